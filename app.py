@@ -3,127 +3,1074 @@ Fitness Tracker AI - STREAMING WEBSOCKET + YOLO11 REALE
 Camera streaming continuo + Frame capture real-time + YOLO11 processing vero + Movement detection + Feedback reale
 """
 import streamlit as st
-import cv2
-import numpy as np
 import time
-from PIL import Image
 import os
+import array
 import base64
-from io import BytesIO
+import itertools
 import json
-import asyncio
+import math
+import sqlite3
 import threading
-from queue import Queue
+import uuid
+from concurrent.futures import Future, TimeoutError as InferenceTimeout
+from queue import Queue, Empty, Full
 
 # Environment setup
 os.environ.setdefault('YOLO_CONFIG_DIR', '/tmp')
 os.environ.setdefault('WANDB_DISABLED', 'true')
 
+# numpy, PIL, ultralytics e torch sono importati in modo lazy: il rerun
+# Streamlit non deve pagarne il costo prima del primo render
+MODEL_WEIGHTS = os.environ.get('FITNESS_MODEL', 'yolo11n-pose.pt')
+PRELOAD_MODEL = os.environ.get('FITNESS_PRELOAD_MODEL', '1') != '0'
+DB_PATH = os.environ.get('FITNESS_DB_PATH', 'workout_history.db')
+
+# Cascade: escalation su modello più grande / input più grande solo sui frame incerti
+ESCALATION_MODEL = os.environ.get('FITNESS_ESCALATION_MODEL', 'yolo11s-pose.pt')
+ESCALATION_MAX_RATE = float(os.environ.get('FITNESS_ESCALATION_MAX_RATE', '1.0'))  # escalation/s
+# Retry del modello di escalation dopo un errore (es. kiosk offline): backoff esponenziale
+ESCALATION_RETRY_BACKOFF = 60.0
+ESCALATION_RETRY_BACKOFF_MAX = 1800.0
+
+def _env_int(name, default=None):
+    """Legge un intero da variabile d'ambiente (default se assente o non valido)"""
+    value = os.environ.get(name, "").strip()
+    try:
+        return int(value) if value else default
+    except ValueError:
+        return default
+
+# Thread torch/OpenCV e pinning CPU: 0/vuoto = default delle librerie
+RUNTIME_DEFAULTS = {
+    "torch_threads": _env_int('FITNESS_TORCH_THREADS', 0),
+    "torch_interop_threads": _env_int('FITNESS_TORCH_INTEROP_THREADS', 0),
+    "cv2_threads": _env_int('FITNESS_CV2_THREADS', -1),
+    "cpu_affinity": os.environ.get('FITNESS_CPU_AFFINITY', ''),
+    "cpus_per_worker": _env_int('FITNESS_CPUS_PER_WORKER', 0)
+}
+
+ESCALATION_IMGSZ = _env_int('FITNESS_ESCALATION_IMGSZ', 960)
+
+# Gate di confidenza e articolazioni chiave per esercizio (mediate a coppie come negli analyzer)
+CONFIDENCE_GATE = 0.6
+KEY_JOINT_GROUPS = {
+    "squat": ((11, 12), (13, 14)),
+    "pushup": ((5, 6), (7, 8)),
+    "bicep_curl": ((7,),)
+}
+
+# Layout fisso dei buffer per-frame (COCO pose: 17 keypoints)
+NUM_KEYPOINTS = 17
+KEYPOINT_CONF_MIN = 0.5
+MOVEMENT_THRESHOLD = 15
+METRIC_FIELDS = {
+    "squat": ("hip_y", "knee_y", "depth_ratio", "knee_alignment"),
+    "pushup": ("shoulder_y", "elbow_y", "depth_ratio"),
+    "bicep_curl": ("elbow_y", "wrist_y", "flexion_pixels", "stability")
+}
+MAX_METRICS = max(len(fields) for fields in METRIC_FIELDS.values())
+
+# Input del modello: il client fa letterbox (lato lungo = MODEL_INPUT_SIZE, padding
+# al multiplo dello stride) così il server non deve ridimensionare
+MODEL_INPUT_SIZE = _env_int('FITNESS_MODEL_INPUT_SIZE', 640)
+MODEL_STRIDE = 32
+
+# Supervisione worker: budget di latenza per inference, heartbeat e riavvio con backoff
+INFERENCE_TIMEOUT = float(os.environ.get('FITNESS_INFERENCE_TIMEOUT', '5.0'))
+WORKER_HANG_TIMEOUT = float(os.environ.get('FITNESS_WORKER_HANG_TIMEOUT', '15.0'))
+WORKER_MAX_CONSECUTIVE_ERRORS = 5
+RESTART_BACKOFF_BASE = 0.5
+RESTART_BACKOFF_MAX = 30.0
+HEALTH_FILE = os.environ.get('FITNESS_HEALTH_FILE', '')
+
 # Global variables for real-time processing
+RESULTS_QUEUE_SIZE = 5
 frame_queue = Queue(maxsize=10)
-analysis_results = Queue(maxsize=5)
+analysis_results = Queue(maxsize=RESULTS_QUEUE_SIZE)
+
+def parse_cpu_list(spec):
+    """Converte '0-3,6' in [0, 1, 2, 3, 6]"""
+    cpus = []
+    for part in (spec or "").split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-', 1)
+            cpus.extend(range(int(start), int(end) + 1))
+        else:
+            cpus.append(int(part))
+    return sorted(set(cpus))
+
+def configure_runtime_threads(torch_threads=0, torch_interop_threads=0, cv2_threads=-1):
+    """Applica thread intra/inter-op torch e OpenCV, restituisce la config effettiva"""
+    import cv2
+    import torch
+
+    if torch_threads and torch_threads > 0:
+        torch.set_num_threads(torch_threads)
+    if torch_interop_threads and torch_interop_threads > 0:
+        try:
+            torch.set_num_interop_threads(torch_interop_threads)
+        except RuntimeError:
+            # Impostabile una sola volta, prima del primo lavoro parallelo
+            print(f"Thread inter-op torch già fissati a {torch.get_num_interop_threads()}: "
+                  f"{torch_interop_threads} ignorato")
+    if cv2_threads is not None and cv2_threads >= 0:
+        cv2.setNumThreads(cv2_threads)
+
+    return {
+        "torch_threads": torch.get_num_threads(),
+        "torch_interop_threads": torch.get_num_interop_threads(),
+        "cv2_threads": cv2.getNumThreads()
+    }
+
+def worker_cpu_set(cpus, cpus_per_worker, worker_index):
+    """Sottoinsieme di core per l'N-esimo worker (round-robin sui core disponibili)"""
+    if not cpus:
+        return []
+    if not cpus_per_worker or cpus_per_worker >= len(cpus):
+        return list(cpus)
+    slots = len(cpus) // cpus_per_worker
+    start = (worker_index % slots) * cpus_per_worker
+    return list(cpus[start:start + cpus_per_worker])
+
+def pin_current_thread(cpus):
+    """Pin del thread corrente sui core indicati (solo Linux)"""
+    if not cpus or not hasattr(os, 'sched_setaffinity'):
+        return False
+    try:
+        # Su Linux l'affinity è per-thread: si usa il TID nativo
+        os.sched_setaffinity(threading.get_native_id(), cpus)
+        return True
+    except OSError as e:
+        print(f"CPU pinning fallito su {cpus}: {e}")
+        return False
+
+def load_model_timed(weights=MODEL_WEIGHTS, configure_threads=True):
+    """Carica YOLO11 + warm-up, misurando import, load e prima inference"""
+    t0 = time.perf_counter()
+    import numpy as np
+    from ultralytics import YOLO
+    t1 = time.perf_counter()
+    # L'inter-op pool va configurato prima della prima inference (solo al primo preload:
+    # dopo lo START i thread scelti in sidebar non vanno riportati ai default)
+    if configure_threads:
+        configure_runtime_threads(
+            RUNTIME_DEFAULTS["torch_threads"],
+            RUNTIME_DEFAULTS["torch_interop_threads"],
+            RUNTIME_DEFAULTS["cv2_threads"]
+        )
+    model = YOLO(weights)
+    t2 = time.perf_counter()
+    # Warm-up: la prima inference inizializza backend e kernel
+    test_img = np.zeros((480, 640, 3), dtype=np.uint8)
+    model(test_img, verbose=False, save=False)
+    t3 = time.perf_counter()
+
+    timings = {
+        "import_s": t1 - t0,
+        "load_s": t2 - t1,
+        "warmup_s": t3 - t2,
+        "total_s": t3 - t0
+    }
+    return model, timings
+
+def create_worker_model(weights=MODEL_WEIGHTS):
+    """Istanza YOLO11 dedicata a un worker: il predictor ultralytics serializza le chiamate con un lock"""
+    import numpy as np
+    from ultralytics import YOLO
+
+    # Pesi già scaricati e backend già inizializzato dal preload: resta solo il warm-up del predictor
+    model = YOLO(weights)
+    model(np.zeros((480, 640, 3), dtype=np.uint8), verbose=False, save=False)
+    return model
 
 def load_yolo_model():
     """Carica YOLO11 per processing real-time"""
     try:
-        from ultralytics import YOLO
         with st.spinner("🤖 Caricamento YOLO11 per streaming real-time..."):
-            model = YOLO('yolo11n-pose.pt')
-            # Test
-            test_img = np.zeros((480, 640, 3), dtype=np.uint8)
-            results = model(test_img, verbose=False, save=False)
+            model, _ = load_model_timed()
             return model
     except Exception as e:
         st.error(f"❌ Errore YOLO11: {e}")
         return None
 
-def process_frame_queue(model, exercise_type):
-    """Thread worker per processing continuo frame YOLO11"""
-    previous_keypoints = None
+class ModelPreloader:
+    """Caricamento YOLO11 in background con stato di readiness (pesi + backend pronti per i worker)"""
+
+    def __init__(self, weights=MODEL_WEIGHTS, worker_spare=False, configure_threads=True,
+                 retry_backoff=0.0, retry_backoff_max=ESCALATION_RETRY_BACKOFF_MAX):
+        self.weights = weights
+        self.configure_threads = configure_threads
+        # Dopo un errore start() riprova solo trascorso il backoff (0 = subito, es. bottone manuale)
+        self.retry_backoff = retry_backoff
+        self.retry_backoff_max = retry_backoff_max
+        self.failures = 0
+        self._retry_at = 0.0
+        # Prima istanza per worker già pronta al "ready": START non carica YOLO nel thread della UI
+        self.worker_spare = worker_spare
+        self.state = "idle"  # idle | loading | ready | error
+        self.model = None
+        self.error = None
+        self.timings = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._spare = None
+        self._spare_loading = False
+
+    @property
+    def ready(self):
+        return self.state == "ready"
+
+    def start(self):
+        """Avvia il caricamento (no-op se già in corso, completato o in backoff dopo un errore)"""
+        with self._lock:
+            if self.state in ("loading", "ready"):
+                return self
+            if self.state == "error" and time.monotonic() < self._retry_at:
+                return self
+            self.state = "loading"
+            self.error = None
+            self._thread = threading.Thread(
+                target=self._load, name=f"preload-{self.weights}", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def wait(self, timeout=None):
+        """Attende la fine del caricamento e restituisce il modello (o None)"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.model
+
+    def take_worker_model(self, refill=True):
+        """Istanza dedicata per un worker: quella pronta se c'è (poi se ne prepara un'altra)"""
+        with self._lock:
+            model, self._spare = self._spare, None
+        if model is None:
+            model = create_worker_model(self.weights)
+        if refill:
+            self._prepare_spare()
+        return model
+
+    def _prepare_spare(self):
+        with self._lock:
+            if self._spare is not None or self._spare_loading:
+                return
+            self._spare_loading = True
+        threading.Thread(target=self._load_spare, name=f"spare-{self.weights}", daemon=True).start()
+
+    def _load_spare(self):
+        try:
+            spare = create_worker_model(self.weights)
+            with self._lock:
+                self._spare = spare
+        except Exception as e:
+            print(f"Istanza worker di riserva fallita: {e}")
+        finally:
+            self._spare_loading = False
 
-    while True:
+    def _load(self):
         try:
-            if not frame_queue.empty():
-                frame_data = frame_queue.get()
+            self.model, self.timings = load_model_timed(self.weights, self.configure_threads)
+            if self.worker_spare:
+                t0 = time.perf_counter()
+                self._spare = create_worker_model(self.weights)
+                self.timings["worker_s"] = time.perf_counter() - t0
+                self.timings["total_s"] += self.timings["worker_s"]
+            self.failures = 0
+            self.state = "ready"
+        except Exception as e:
+            self.error = str(e)
+            self.failures += 1
+            if self.retry_backoff:
+                delay = min(self.retry_backoff * 2 ** (self.failures - 1), self.retry_backoff_max)
+                self._retry_at = time.monotonic() + delay
+                print(f"Caricamento {self.weights} fallito ({e}): nuovo tentativo tra {delay:.0f}s")
+            self.state = "error"
+
+@st.cache_resource(show_spinner=False)
+def get_model_preloader(weights=MODEL_WEIGHTS):
+    """Preloader condiviso dal server: parte alla prima sessione, non ad ogni rerun.
+
+    Il modello precaricato fa da cache di pesi e warm-up: ogni worker usa una propria istanza
+    (take_worker_model), altrimenti tutte le sessioni si serializzano sul suo predictor.
+    """
+    return ModelPreloader(weights, worker_spare=True).start()
+
+@st.cache_resource(show_spinner=False)
+def get_worker_counter():
+    """Contatore dei worker avviati dal server, per assegnare i core in round-robin"""
+    return itertools.count()
+
+@st.fragment(run_every=1.0)
+def model_readiness_indicator(preloader):
+    """Indicatore di readiness: fa polling finché il modello in background non è pronto"""
+    if preloader.state == "ready":
+        st.session_state.model = preloader.model
+        st.rerun()
+    elif preloader.state == "error":
+        st.error(f"❌ Errore YOLO11: {preloader.error}")
+    else:
+        st.info("⏳ YOLO11 in caricamento in background...")
+
+HEALTH_LABELS = {
+    "starting": "🔵 AVVIO",
+    "healthy": "🟢 ATTIVO",
+    "degraded": "🟡 DEGRADATO",
+    "restarting": "🟠 RIAVVIO",
+    "stopped": "⚪ FERMO"
+}
+
+@st.fragment(run_every=2.0)
+def worker_health_indicator(supervisor):
+    """Stato reale del worker (heartbeat, timeout, riavvii) invece del solo flag di START"""
+    status = supervisor.status()
+    st.metric("🔄 Sistema", HEALTH_LABELS.get(status["state"], status["state"]))
+    st.caption(
+        f"💓 {status['heartbeat_age_s']:.1f}s fa · ⏱️ timeout {status['inference_timeouts']} · "
+        f"🔁 riavvii {status['restarts']}"
+    )
+    if status["state"] == "restarting" and status["last_problem"]:
+        st.warning(f"Worker {status['last_problem']}")
 
-                if frame_data is None:  # Signal to stop
-                    break
+@st.cache_resource(show_spinner=False)
+def get_escalation_preloader(weights=ESCALATION_MODEL):
+    """Preloader del modello di escalation: non avviato, parte alla prima escalation"""
+    return ModelPreloader(weights, configure_threads=False, retry_backoff=ESCALATION_RETRY_BACKOFF)
+
+def _to_numpy(tensor):
+    """Vista numpy di un tensore (copia solo se su GPU)"""
+    return tensor.cpu().numpy() if hasattr(tensor, 'cpu') else tensor
+
+def extract_keypoints_into(results, keypoints_out, confidence_out):
+    """Copia keypoints e confidenze della prima persona nei buffer preallocati (False se nessuna)"""
+    import numpy as np
 
-                # Decodifica frame
-                header, encoded = frame_data.split(',', 1)
-                image_bytes = base64.b64decode(encoded)
-                image = Image.open(BytesIO(image_bytes))
-                frame_array = np.array(image)
+    if len(results) == 0 or results[0].keypoints is None or len(results[0].keypoints.xy) == 0:
+        return False
 
-                # YOLO11 inference REALE
-                results = model(frame_array, verbose=False, save=False)
+    keypoints = results[0].keypoints
+    np.copyto(keypoints_out, _to_numpy(keypoints.xy[0]))
+    if keypoints.conf is not None:
+        np.copyto(confidence_out, _to_numpy(keypoints.conf[0]))
+    else:
+        confidence_out.fill(1.0)
+    return True
+
+def key_joint_confidence(confidence, exercise_type):
+    """Confidenza del gruppo di articolazioni più debole per l'esercizio"""
+    if confidence is None or len(confidence) < 17:
+        return 0.0
+    groups = KEY_JOINT_GROUPS.get(exercise_type, ())
+    if not groups:
+        return 1.0
+    return min(sum(float(confidence[i]) for i in group) / len(group) for group in groups)
+
+class PoseCascade:
+    """Nano di default, escalation (modello più grande o input più grande) solo sui frame incerti"""
+
+    def __init__(self, model, escalation=None, imgsz=ESCALATION_IMGSZ, gate=CONFIDENCE_GATE,
+                 max_rate=ESCALATION_MAX_RATE, burst=2, fallback_weights=MODEL_WEIGHTS):
+        self.model = model
+        self.escalation = escalation  # ModelPreloader, caricato alla prima escalation
+        self.imgsz = imgsz
+        self.fallback_weights = fallback_weights
+        # Istanze proprie (create al primo uso): gli args di predict non si mescolano tra sessioni
+        self._escalation_model = None
+        self._fallback_model = None
+        self.gate = gate
+        self.max_rate = max_rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last_refill = time.perf_counter()
+
+        import numpy as np
+        self._esc_keypoints = np.zeros((NUM_KEYPOINTS, 2), dtype=np.float32)
+        self._esc_confidence = np.zeros(NUM_KEYPOINTS, dtype=np.float32)
+
+        self.frames = 0
+        self.base_covered = 0
+        self.escalations = 0
+        self.rate_limited = 0
+        self.unavailable = 0
+        self.rescued = 0
+        self.escalation_seconds = 0.0
+
+    def _allow_escalation(self):
+        """Token bucket: al massimo max_rate escalation/s con burst limitato"""
+        if self.max_rate <= 0:
+            return False
+        now = time.perf_counter()
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.max_rate)
+        self._last_refill = now
+        if self._tokens < 1.0:
+            return False
+        self._tokens -= 1.0
+        return True
+
+    def _fallback_imgsz(self, frame_array):
+        """imgsz del fallback limitato alla risoluzione del frame: 0 se sarebbe solo un upsampling"""
+        long_side = max(frame_array.shape[:2])
+        imgsz = min(self.imgsz, math.ceil(long_side / MODEL_STRIDE) * MODEL_STRIDE)
+        return imgsz if imgsz > MODEL_INPUT_SIZE else 0
+
+    def _can_escalate(self, frame_array):
+        """Modello grande pronto, oppure frame con più dettaglio dell'input base"""
+        if self.escalation is not None:
+            self.escalation.start()
+            if self.escalation.ready:
+                return True
+        return self._fallback_imgsz(frame_array) > 0
+
+    def _escalate(self, frame_array):
+        """Modello grande se pronto, altrimenti un nano dedicato a risoluzione maggiore"""
+        from ultralytics import YOLO
 
-                if len(results) > 0 and results[0].keypoints is not None:
-                    keypoints_tensor = results[0].keypoints.xy[0]
-                    confidence_tensor = results[0].keypoints.conf[0] if results[0].keypoints.conf is not None else None
+        if self.escalation is not None:
+            if self.escalation.ready:
+                # Pesi già in cache dal preloader condiviso, istanza propria della cascade
+                if self._escalation_model is None:
+                    self._escalation_model = YOLO(self.escalation.weights)
+                return self._escalation_model(frame_array, verbose=False, save=False)
+        # Mai imgsz per-chiamata sul modello del worker: ultralytics sostituisce gli args del predictor
+        if self._fallback_model is None:
+            self._fallback_model = YOLO(self.fallback_weights)
+        return self._fallback_model(frame_array, imgsz=self._fallback_imgsz(frame_array), verbose=False, save=False)
+
+    def infer_into(self, frame_array, exercise_type, keypoints_out, confidence_out):
+        """Inference a cascata nei buffer forniti: True se è stata rilevata una persona"""
+        import numpy as np
+
+        self.frames += 1
+        found = extract_keypoints_into(
+            self.model(frame_array, verbose=False, save=False), keypoints_out, confidence_out
+        )
+        if not found:
+            return False  # stanza vuota: niente budget di escalation sprecato
+        base_conf = key_joint_confidence(confidence_out, exercise_type)
+        if base_conf > self.gate:
+            self.base_covered += 1
+            return True
+
+        if not self._can_escalate(frame_array):
+            # Frame già letterbox a MODEL_INPUT_SIZE dal browser: serve il modello grande
+            self.unavailable += 1
+            return True
+        if not self._allow_escalation():
+            self.rate_limited += 1
+            return True
+
+        t0 = time.perf_counter()
+        esc_found = extract_keypoints_into(
+            self._escalate(frame_array), self._esc_keypoints, self._esc_confidence
+        )
+        self.escalation_seconds += time.perf_counter() - t0
+        self.escalations += 1
+
+        esc_conf = key_joint_confidence(self._esc_confidence, exercise_type) if esc_found else 0.0
+        if esc_conf <= base_conf:
+            return True
+        if esc_conf > self.gate:
+            self.rescued += 1
+        np.copyto(keypoints_out, self._esc_keypoints)
+        np.copyto(confidence_out, self._esc_confidence)
+        return True
+
+    def infer(self, frame_array, exercise_type):
+        """Come infer_into, ma restituisce nuovi array (keypoints, confidence) o (None, None)"""
+        import numpy as np
+
+        keypoints = np.zeros((NUM_KEYPOINTS, 2), dtype=np.float32)
+        confidence = np.zeros(NUM_KEYPOINTS, dtype=np.float32)
+        if not self.infer_into(frame_array, exercise_type, keypoints, confidence):
+            return None, None
+        return keypoints, confidence
+
+    def handover(self, model):
+        """Stessa configurazione e contatori su un nuovo modello (il vecchio resta al thread bloccato)"""
+        successor = PoseCascade(
+            model, self.escalation, self.imgsz, self.gate, self.max_rate, self.burst, self.fallback_weights
+        )
+        for name in ("frames", "base_covered", "escalations", "rate_limited", "unavailable", "rescued",
+                     "escalation_seconds"):
+            setattr(successor, name, getattr(self, name))
+        return successor
+
+    def stats(self):
+        """Report: tasso di escalation, latenza aggiunta e copertura guadagnata"""
+        frames = max(self.frames, 1)
+        return {
+            "frames": self.frames,
+            "escalations": self.escalations,
+            "escalation_rate": self.escalations / frames,
+            "rate_limited": self.rate_limited,
+            "unavailable": self.unavailable,
+            "added_latency_ms_per_escalation": 1000 * self.escalation_seconds / max(self.escalations, 1),
+            "added_latency_ms_per_frame": 1000 * self.escalation_seconds / frames,
+            "base_coverage": self.base_covered / frames,
+            "coverage_gained": self.rescued / frames
+        }
 
-                    keypoints = keypoints_tensor.cpu().numpy() if hasattr(keypoints_tensor, 'cpu') else np.array(keypoints_tensor)
-                    confidence = confidence_tensor.cpu().numpy() if hasattr(confidence_tensor, 'cpu') and confidence_tensor is not None else None
+class FrameResult:
+    """Record risultato di un frame, riusato dal ring buffer del worker"""
 
-                    # Movement detection
-                    movement_detected = False
-                    total_movement = 0
+    __slots__ = (
+        "timestamp", "capture_ts", "exercise", "keypoints", "confidence", "metrics", "feedback_msg",
+        "voice_msg", "status", "movement_detected", "total_movement", "reps", "keypoint_conf_min"
+    )
 
-                    if previous_keypoints is not None and len(previous_keypoints) == len(keypoints):
-                        for i in range(len(keypoints)):
-                            if confidence is None or confidence[i] > 0.5:
-                                dx = keypoints[i][0] - previous_keypoints[i][0]
-                                dy = keypoints[i][1] - previous_keypoints[i][1]
-                                movement = np.sqrt(dx*dx + dy*dy)
-                                total_movement += movement
+    def __init__(self):
+        import numpy as np
+
+        self.timestamp = 0.0
+        self.capture_ts = 0.0
+        self.exercise = ""
+        self.keypoints = np.zeros((NUM_KEYPOINTS, 2), dtype=np.float32)
+        self.confidence = np.zeros(NUM_KEYPOINTS, dtype=np.float32)
+        self.metrics = np.zeros(MAX_METRICS, dtype=np.float32)
+        self.feedback_msg = ""
+        self.voice_msg = ""
+        self.status = "neutral"
+        self.movement_detected = False
+        self.total_movement = 0.0
+        self.reps = 0
+        self.keypoint_conf_min = KEYPOINT_CONF_MIN
+
+    def to_dict(self):
+        """Risultato per la UI: le allocazioni avvengono nel thread Streamlit, non nel worker"""
+        analysis_data = {"exercise": self.exercise}
+        analysis_data.update(zip(METRIC_FIELDS.get(self.exercise, ()), map(float, self.metrics)))
+        return {
+            'timestamp': self.timestamp,
+            'capture_ts': self.capture_ts,
+            'keypoints': [
+                {'id': i, 'x': float(self.keypoints[i, 0]), 'y': float(self.keypoints[i, 1]),
+                 'conf': float(self.confidence[i])}
+                for i in range(NUM_KEYPOINTS) if self.confidence[i] > self.keypoint_conf_min
+            ],
+            'feedback_msg': self.feedback_msg,
+            'voice_msg': self.voice_msg,
+            'status': self.status,
+            'movement_detected': self.movement_detected,
+            'total_movement': self.total_movement,
+            'analysis_data': analysis_data,
+            'reps': self.reps
+        }
 
-                        movement_detected = total_movement > 15  # threshold
+class ResultRing:
+    """Ring di FrameResult preallocati: si avanza solo quando il record è pubblicato"""
+
+    def __init__(self, size):
+        self._records = [FrameResult() for _ in range(size)]
+        self._index = 0
+
+    def current(self):
+        return self._records[self._index]
+
+    def advance(self):
+        self._index = (self._index + 1) % len(self._records)
+
+class PipelineControl:
+    """Canale di controllo UI -> worker: le modifiche si applicano al confine tra due frame"""
+
+    SETTINGS = ("exercise_type", "movement_threshold", "confidence_gate", "keypoint_conf_min")
+
+    def __init__(self, **settings):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self.settings = {}
+        self.applied = 0
+        self.update(**settings)
+
+    def update(self, **settings):
+        """Accoda solo i valori cambiati rispetto all'ultima richiesta (thread Streamlit)"""
+        unknown = set(settings) - set(self.SETTINGS)
+        if unknown:
+            raise ValueError(f"Impostazioni sconosciute: {', '.join(sorted(unknown))}")
+        with self._lock:
+            changed = {key: value for key, value in settings.items() if self.settings.get(key) != value}
+            self.settings.update(changed)
+            self._pending.update(changed)
+        return bool(changed)
+
+    def take(self):
+        """Modifiche in attesa (worker), None se non ce ne sono"""
+        if not self._pending:
+            return None
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        self.applied += 1
+        return pending
+
+class FrameProcessor:
+    """Percorso per-frame di un worker: buffer float32 fissi riusati frame dopo frame"""
+
+    def __init__(self, cascade, exercise_type, athlete=None, store=None,
+                 ring_size=RESULTS_QUEUE_SIZE + 3, latency_window=1024, control=None):
+        import numpy as np
+
+        self.cascade = cascade
+        self.exercise_type = exercise_type
+        self.athlete = athlete
+        self.store = store
+        self.control = control
+        self.movement_threshold = MOVEMENT_THRESHOLD
+        self.confidence_gate = CONFIDENCE_GATE
+        self.keypoint_conf_min = KEYPOINT_CONF_MIN
+        # Più slot della coda risultati: un record in coda o letto dalla UI non viene sovrascritto
+        self.ring = ResultRing(ring_size)
+        self.rep_counter = RepCounter(exercise_type)
+
+        self._previous = np.zeros((NUM_KEYPOINTS, 2), dtype=np.float32)
+        self._has_previous = False
+        self._diff = np.zeros((NUM_KEYPOINTS, 2), dtype=np.float32)
+        self._distance = np.zeros(NUM_KEYPOINTS, dtype=np.float32)
+        self._visible = np.zeros(NUM_KEYPOINTS, dtype=bool)
+
+        self.set_id = uuid.uuid4().hex
+        self.set_stats = SetAggregator(exercise_type)
+
+        # Contatori e finestra di latenze capture->risultato (secondi)
+        self.frames = 0
+        self.no_person = 0
+        self.dropped = 0
+        self.latencies = array.array('d', bytes(8 * latency_window))
+        self.latency_count = 0
+        self.cpu_seconds = 0.0  # CPU del thread di inference (decode escluso)
+        # Sostituito da handover(): un'inference abbandonata non tocca più il set condiviso
+        self.retired = False
+
+    def latency_samples(self):
+        """Latenze dell'ultima finestra (tutte, se il run è più corto della finestra)"""
+        return self.latencies[:min(self.latency_count, len(self.latencies))].tolist()
+
+    def _movement(self, keypoints, confidence):
+        """Somma degli spostamenti dei keypoints visibili rispetto al frame precedente"""
+        import numpy as np
+
+        np.subtract(keypoints, self._previous, out=self._diff)
+        np.multiply(self._diff, self._diff, out=self._diff)
+        np.sum(self._diff, axis=1, out=self._distance)
+        np.sqrt(self._distance, out=self._distance)
+        np.greater(confidence, self.keypoint_conf_min, out=self._visible)
+        np.multiply(self._distance, self._visible, out=self._distance)
+        return float(self._distance.sum())
+
+    def apply_settings(self, settings):
+        """Impostazioni dal canale di controllo; un nuovo esercizio chiude il set e ne apre un altro"""
+        exercise_type = settings.get("exercise_type", self.exercise_type)
+        if exercise_type != self.exercise_type:
+            self.finish()
+            self.exercise_type = exercise_type
+            self.rep_counter = RepCounter(exercise_type)
+            self.set_id = uuid.uuid4().hex
+            self.set_stats = SetAggregator(exercise_type)
+        if "movement_threshold" in settings:
+            self.movement_threshold = float(settings["movement_threshold"])
+        if "confidence_gate" in settings:
+            self.confidence_gate = float(settings["confidence_gate"])
+            self.cascade.gate = self.confidence_gate  # stesso gate per analisi ed escalation
+        if "keypoint_conf_min" in settings:
+            self.keypoint_conf_min = float(settings["keypoint_conf_min"])
+
+    def process(self, frame_array, meta=None):
+        """Inference + analisi nel record corrente del ring (None se nessuna persona)"""
+        cpu_start = time.thread_time()
+        if self.control is not None:
+            settings = self.control.take()
+            if settings:
+                self.apply_settings(settings)
+
+        record = self._analyze(frame_array, meta)
+        self.frames += 1
+        if record is None:
+            self.no_person += 1
+
+        # Latenza end-to-end dal timestamp di cattura del client
+        capture_ts = meta.get('ts') if meta else None
+        if capture_ts:
+            self.latencies[self.latency_count % len(self.latencies)] = time.time() - capture_ts
+            self.latency_count += 1
+            if record is not None:
+                record.capture_ts = capture_ts
+        self.cpu_seconds += time.thread_time() - cpu_start
+        return record
+
+    def _analyze(self, frame_array, meta):
+        import numpy as np
+
+        record = self.ring.current()
+        if not self.cascade.infer_into(frame_array, self.exercise_type, record.keypoints, record.confidence):
+            return None
+        if meta:
+            unletterbox_keypoints(record.keypoints, meta)
+
+        # Movement detection
+        total_movement = self._movement(record.keypoints, record.confidence) if self._has_previous else 0.0
+        movement_detected = self._has_previous and total_movement > self.movement_threshold
+
+        # Analisi esercizio
+        record.feedback_msg, record.voice_msg, record.status = analyze_exercise_real_time(
+            record.keypoints, record.confidence, self.exercise_type, movement_detected, total_movement,
+            self.confidence_gate
+        )
+        record.timestamp = time.time()
+        record.exercise = self.exercise_type
+        record.keypoint_conf_min = self.keypoint_conf_min
+        record.movement_detected = movement_detected
+        record.total_movement = total_movement
+        compute_metrics_into(record.keypoints, self.exercise_type, record.metrics)
+        if self.retired:
+            return None  # inference sbloccata dopo l'handover: rep e statistiche sono del successore
+        if record.status in ANALYZED_STATUSES:
+            self.set_stats.add_frame(record.metrics, record.timestamp)
+
+        # Conteggio rep + storico (il writer SQLite è asincrono), solo con articolazioni sopra il gate:
+        # i keypoints che l'analisi scarta ("posizionati di lato") non contano né salvano rep
+        if key_joint_confidence(record.confidence, self.exercise_type) > self.confidence_gate:
+            rep = self.rep_counter.update(float(record.metrics[self.rep_counter.metric_index]), record.timestamp)
+            if rep is not None:
+                self.set_stats.add_rep(rep)
+                if self.store is not None:
+                    self.store.record_rep(self.athlete, self.exercise_type, self.set_id, rep)
+        record.reps = self.rep_counter.count
+
+        np.copyto(self._previous, record.keypoints)
+        self._has_previous = True
+        return record
+
+    def publish(self, record, results_queue):
+        """Pubblica il record e passa allo slot successivo (scartato se la UI è indietro)"""
+        try:
+            results_queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+            return False
+        self.ring.advance()
+        return True
+
+    def handover(self, cascade=None):
+        """Nuovo processor con buffer propri ma stesso set, per sostituire un worker bloccato"""
+        self.retired = True
+        successor = FrameProcessor(
+            cascade or self.cascade, self.exercise_type, self.athlete, self.store,
+            ring_size=len(self.ring._records), latency_window=len(self.latencies), control=self.control
+        )
+        successor.movement_threshold = self.movement_threshold
+        successor.confidence_gate = self.confidence_gate
+        successor.keypoint_conf_min = self.keypoint_conf_min
+        successor.rep_counter = self.rep_counter
+        successor.set_id = self.set_id
+        successor.set_stats = self.set_stats
+        successor.frames = self.frames
+        successor.no_person = self.no_person
+        successor.dropped = self.dropped
+        successor.cpu_seconds = self.cpu_seconds
+        return successor
+
+    def finish(self):
+        """Chiude il set corrente registrandone il riepilogo"""
+        if self.store is not None and self.rep_counter.count:
+            self.store.record_set(self.athlete, self.exercise_type, self.set_id, self.set_stats.summary())
+
+def decode_frame(frame_data):
+    """Data URL JPEG -> array BGR (il formato atteso da YOLO per input numpy)"""
+    import cv2
+    import numpy as np
+
+    encoded = frame_data[frame_data.index(',') + 1:]
+    buffer = np.frombuffer(base64.b64decode(encoded), dtype=np.uint8)
+    return cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+
+def decode_frame_payload(frame_data):
+    """Payload del client -> (frame BGR, meta letterbox); accetta anche il data URL legacy"""
+    if frame_data.startswith('{'):
+        payload = json.loads(frame_data)
+        return decode_frame(payload['image']), payload.get('meta') or {}
+    return decode_frame(frame_data), {}
+
+def unletterbox_keypoints(keypoints, meta):
+    """Riporta in place i keypoints dal frame letterbox alle coordinate display del client"""
+    keypoints[:, 0] -= meta.get('pad_x', 0)
+    keypoints[:, 1] -= meta.get('pad_y', 0)
+    keypoints /= meta.get('scale') or 1.0
+
+class WorkerHealth:
+    """Stato condiviso worker <-> supervisor: heartbeat, inference in corso, errori"""
+
+    def __init__(self):
+        self.heartbeat = time.monotonic()
+        self.inference_started = None
+        self.pending = None  # Future dell'inference in corso (anche se oltre budget)
+        self.timeouts = 0
+        self.errors = 0
+        self.last_error = None
+        self.stop = threading.Event()
+
+    def beat(self):
+        self.heartbeat = time.monotonic()
+
+    def inference_in_flight(self):
+        """True se un'inference (anche abbandonata dal worker) sta ancora girando"""
+        pending = self.pending
+        return pending is not None and not pending.done()
+
+class InferenceThread:
+    """Thread daemon per l'inference: se resta bloccato non impedisce l'uscita del processo
+    (i thread di ThreadPoolExecutor vengono attesi alla chiusura dell'interprete)"""
+
+    def __init__(self):
+        self._jobs = Queue()
+        self._thread = threading.Thread(target=self._run, name="inference", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args):
+        future = Future()
+        self._jobs.put((future, fn, args))
+        return future
+
+    def shutdown(self):
+        """Chiude il thread appena libero, senza attenderlo"""
+        self._jobs.put(None)
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            future, fn, args = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)
+
+def process_frame_queue(model, exercise_type, cpu_set=None, athlete=None, store=None, cascade=None,
+                        input_queue=None, output_queue=None, processor=None, health=None,
+                        inference_timeout=INFERENCE_TIMEOUT):
+    """Thread worker per processing continuo frame YOLO11"""
+    if cpu_set:
+        pin_current_thread(cpu_set)
+    if cascade is None:
+        cascade = PoseCascade(model, max_rate=0)  # solo nano, nessuna escalation
+
+    input_queue = frame_queue if input_queue is None else input_queue
+    output_queue = analysis_results if output_queue is None else output_queue
+    if processor is None:
+        processor = FrameProcessor(cascade, exercise_type, athlete, store)
+    if health is None:
+        health = WorkerHealth()
+
+    # Inference in un thread dedicato: il worker resta reattivo anche se il modello si blocca
+    inference = InferenceThread()
+    consecutive_errors = 0
 
-                    # Analisi esercizio
-                    feedback_msg, voice_msg, status = analyze_exercise_real_time(
-                        keypoints, confidence, exercise_type, movement_detected, total_movement
-                    )
+    try:
+        while not health.stop.is_set():
+            health.beat()
+            try:
+                try:
+                    frame_data = input_queue.get(timeout=0.1)  # Wait for new frames
+                except Empty:
+                    continue
 
-                    # Keypoints per visualizzazione
-                    keypoints_list = []
-                    confidence_list = []
-
-                    if keypoints is not None:
-                        for i, kp in enumerate(keypoints):
-                            if confidence is None or confidence[i] > 0.5:
-                                keypoints_list.append({
-                                    'id': i,
-                                    'x': float(kp[0]),
-                                    'y': float(kp[1]),
-                                    'conf': float(confidence[i]) if confidence is not None else 1.0
-                                })
-
-                    # Risultato per UI
-                    result = {
-                        'timestamp': time.time(),
-                        'keypoints': keypoints_list,
-                        'feedback_msg': feedback_msg,
-                        'voice_msg': voice_msg,
-                        'status': status,
-                        'movement_detected': movement_detected,
-                        'total_movement': total_movement,
-                        'analysis_data': analyze_metrics(keypoints, confidence, exercise_type)
-                    }
-
-                    # Aggiungi a results queue
-                    if not analysis_results.full():
-                        analysis_results.put(result)
-
-                    previous_keypoints = keypoints
+                if frame_data is None:  # Signal to stop
+                    processor.finish()
+                    break
 
-            else:
-                time.sleep(0.1)  # Wait for new frames
+                if health.pending is not None:
+                    if not health.pending.done():
+                        processor.dropped += 1  # inference precedente ancora oltre budget
+                        continue
+                    health.pending = None
+                    health.inference_started = None
+
+                # Decodifica frame (già letterbox lato client) + YOLO11 inference REALE
+                frame_array, meta = decode_frame_payload(frame_data)
+                health.inference_started = time.monotonic()
+                health.pending = inference.submit(processor.process, frame_array, meta)
+                try:
+                    record = health.pending.result(timeout=inference_timeout)
+                except InferenceTimeout:
+                    health.timeouts += 1
+                    print(f"Inference oltre il budget di {inference_timeout:.1f}s: frame scartato")
+                    continue
+                health.pending = None
+                health.inference_started = None
+
+                if record is not None:
+                    processor.publish(record, output_queue)
+                consecutive_errors = 0
+
+            except Exception as e:
+                health.pending = None
+                health.inference_started = None
+                health.errors += 1
+                health.last_error = str(e)
+                consecutive_errors += 1
+                print(f"Error in frame processing: {e}")
+                if consecutive_errors >= WORKER_MAX_CONSECUTIVE_ERRORS:
+                    raise  # il supervisor riavvia il worker
+                time.sleep(0.1)
+    finally:
+        inference.shutdown()
+
+class WorkerSupervisor:
+    """Avvia il worker, ne controlla heartbeat e latenza e lo riavvia con backoff esponenziale"""
+
+    def __init__(self, model, exercise_type, processor, cpu_set=None, athlete=None, store=None, cascade=None,
+                 input_queue=None, output_queue=None, inference_timeout=INFERENCE_TIMEOUT,
+                 hang_timeout=WORKER_HANG_TIMEOUT, check_interval=0.5, health_file=HEALTH_FILE,
+                 model_factory=None):
+        self.model = model
+        # Nuovo modello dopo un'inference bloccata: il predictor ultralytics resta sotto lock
+        self.model_factory = model_factory
+        self.exercise_type = exercise_type
+        self.processor = processor
+        self.cpu_set = cpu_set
+        self.athlete = athlete
+        self.store = store
+        self.cascade = cascade
+        self.input_queue = frame_queue if input_queue is None else input_queue
+        self.output_queue = analysis_results if output_queue is None else output_queue
+        self.inference_timeout = inference_timeout
+        self.hang_timeout = hang_timeout
+        self.check_interval = check_interval
+        self.health_file = health_file
+
+        self.state = "starting"  # starting | healthy | degraded | restarting | stopped
+        self.restarts = 0
+        self.handovers = 0
+        self.last_problem = None
+        self.health = None
+        self.thread = None
+        self._backoff = RESTART_BACKOFF_BASE
+        self._spawned_at = 0.0
+        self._seen_timeouts = 0
+        self._degraded_until = 0.0
+        self._stopping = threading.Event()
+        self._monitor = threading.Thread(target=self._run, name="worker-supervisor", daemon=True)
+
+    def start(self):
+        self._spawn()
+        self._monitor.start()
+        return self
+
+    def stop(self):
+        """Stop ordinato: il worker chiude il set e termina, nessun riavvio"""
+        self._stopping.set()
+        if self.thread is not None and self.thread.is_alive():
+            self.input_queue.put(None)
+        else:
+            self.processor.finish()
+        self.state = "stopped"
+        self._write_health_file()
+
+    def _spawn(self):
+        self.health = WorkerHealth()
+        self._seen_timeouts = 0
+        self._spawned_at = time.monotonic()
+        self.thread = threading.Thread(
+            target=process_frame_queue,
+            args=(self.model, self.exercise_type, self.cpu_set, self.athlete, self.store, self.cascade),
+            kwargs={
+                "input_queue": self.input_queue, "output_queue": self.output_queue,
+                "processor": self.processor, "health": self.health,
+                "inference_timeout": self.inference_timeout
+            },
+            name="frame-worker",
+            daemon=True
+        )
+        self.thread.start()
+
+    def _check(self):
+        """Motivo del riavvio, o None se il worker è vivo e reattivo"""
+        if not self.thread.is_alive():
+            return f"terminato ({self.health.last_error or 'uscita inattesa'})"
+        now = time.monotonic()
+        if now - self.health.heartbeat > self.hang_timeout:
+            return f"bloccato (nessun heartbeat da {now - self.health.heartbeat:.0f}s)"
+        started = self.health.inference_started
+        if started is not None and now - started > self.hang_timeout:
+            return f"bloccato (inference in corso da {now - started:.0f}s)"
+        return None
 
-        except Exception as e:
-            print(f"Error in frame processing: {e}")
-            time.sleep(0.1)
+    def _run(self):
+        while not self._stopping.wait(self.check_interval):
+            problem = self._check()
+            now = time.monotonic()
+
+            if problem is None:
+                if self.health.timeouts > self._seen_timeouts:
+                    self._seen_timeouts = self.health.timeouts
+                    self._degraded_until = now + 10.0
+                self.state = "degraded" if now < self._degraded_until else "healthy"
+                if now - self._spawned_at > 60.0:
+                    self._backoff = RESTART_BACKOFF_BASE  # stabile: azzera il backoff
+                self._write_health_file()
+                continue
+
+            self.state = "restarting"
+            self.last_problem = problem
+            print(f"Worker {problem}: riavvio tra {self._backoff:.1f}s")
+            self._write_health_file()
+            self.health.stop.set()  # se il vecchio worker si sblocca, esce
+            if self._stopping.wait(self._backoff):
+                break
+            self._backoff = min(self._backoff * 2, RESTART_BACKOFF_MAX)
+
+            if self.health.inference_in_flight():
+                # Il worker esce da solo, ma l'inference abbandonata gira ancora dentro il processor:
+                # il nuovo worker usa buffer (e, se possibile, modello) propri
+                self._handover()
+            self.restarts += 1
+            self._spawn()
+
+    def _handover(self):
+        cascade = None
+        if self.model_factory is not None:
+            try:
+                self.model = self.model_factory()
+                cascade = self.cascade = self.processor.cascade.handover(self.model)
+            except Exception as e:
+                print(f"Nuovo modello per il worker fallito, riuso il precedente: {e}")
+        self.processor = self.processor.handover(cascade)
+        self.handovers += 1
+
+    def status(self):
+        """Stato di salute per UI e controlli esterni"""
+        health = self.health
+        return {
+            "state": self.state,
+            "alive": self.thread is not None and self.thread.is_alive(),
+            "restarts": self.restarts,
+            "handovers": self.handovers,
+            "heartbeat_age_s": time.monotonic() - health.heartbeat if health else None,
+            "inference_timeouts": health.timeouts if health else 0,
+            "errors": health.errors if health else 0,
+            "last_problem": self.last_problem,
+            "frames": self.processor.frames,
+            "timestamp": time.time()
+        }
 
-def analyze_exercise_real_time(keypoints, confidence, exercise_type, movement_detected, total_movement):
+    def _write_health_file(self):
+        """Health check per kiosk/watchdog esterni (scrittura atomica)"""
+        if not self.health_file:
+            return
+        try:
+            tmp_path = f"{self.health_file}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.status(), f)
+            os.replace(tmp_path, self.health_file)
+        except OSError as e:
+            print(f"Scrittura health file fallita: {e}")
+
+def analyze_exercise_real_time(keypoints, confidence, exercise_type, movement_detected, total_movement,
+                               gate=CONFIDENCE_GATE):
     """Analisi esercizio real-time con movement detection"""
     try:
         if not movement_detected:
@@ -133,24 +1080,24 @@ def analyze_exercise_real_time(keypoints, confidence, exercise_type, movement_de
             return "⚠️ Keypoints non sufficienti", "Posizionati meglio!", "error"
 
         if exercise_type == "squat":
-            return analyze_squat_realtime(keypoints, confidence, total_movement)
+            return analyze_squat_realtime(keypoints, confidence, total_movement, gate)
         elif exercise_type == "pushup":
-            return analyze_pushup_realtime(keypoints, confidence, total_movement)
+            return analyze_pushup_realtime(keypoints, confidence, total_movement, gate)
         elif exercise_type == "bicep_curl":
-            return analyze_curl_realtime(keypoints, confidence, total_movement)
+            return analyze_curl_realtime(keypoints, confidence, total_movement, gate)
 
         return "👤 Persona rilevata in movimento", "", "neutral"
 
     except Exception as e:
         return f"❌ Errore analisi: {str(e)}", "", "error"
 
-def analyze_squat_realtime(keypoints, confidence, movement):
+def analyze_squat_realtime(keypoints, confidence, movement, gate=CONFIDENCE_GATE):
     """Analisi squat real-time"""
     try:
         hips_conf = (confidence[11] + confidence[12]) / 2
         knees_conf = (confidence[13] + confidence[14]) / 2
 
-        if hips_conf > 0.6 and knees_conf > 0.6:
+        if hips_conf > gate and knees_conf > gate:
             hip_y = (keypoints[11][1] + keypoints[12][1]) / 2
             knee_y = (keypoints[13][1] + keypoints[14][1]) / 2
             depth_ratio = hip_y / knee_y
@@ -181,13 +1128,13 @@ def analyze_squat_realtime(keypoints, confidence, movement):
     except Exception as e:
         return f"Errore squat: {str(e)}", "", "error"
 
-def analyze_pushup_realtime(keypoints, confidence, movement):
+def analyze_pushup_realtime(keypoints, confidence, movement, gate=CONFIDENCE_GATE):
     """Analisi push-up real-time"""
     try:
         shoulders_conf = (confidence[5] + confidence[6]) / 2
         elbows_conf = (confidence[7] + confidence[8]) / 2
 
-        if shoulders_conf > 0.6 and elbows_conf > 0.6:
+        if shoulders_conf > gate and elbows_conf > gate:
             shoulder_y = (keypoints[5][1] + keypoints[6][1]) / 2
             elbow_y = (keypoints[7][1] + keypoints[8][1]) / 2
             depth_ratio = elbow_y / shoulder_y
@@ -212,12 +1159,12 @@ def analyze_pushup_realtime(keypoints, confidence, movement):
     except Exception as e:
         return f"Errore push-up: {str(e)}", "", "error"
 
-def analyze_curl_realtime(keypoints, confidence, movement):
+def analyze_curl_realtime(keypoints, confidence, movement, gate=CONFIDENCE_GATE):
     """Analisi curl real-time"""
     try:
         elbow_conf = confidence[7]
 
-        if elbow_conf > 0.6:
+        if elbow_conf > gate:
             elbow_y = keypoints[7][1]
             wrist_y = keypoints[9][1]
             shoulder_y = keypoints[5][1]
@@ -249,51 +1196,433 @@ def analyze_curl_realtime(keypoints, confidence, movement):
     except Exception as e:
         return f"Errore curl: {str(e)}", "", "error"
 
+def compute_metrics_into(keypoints, exercise_type, out):
+    """Metriche dell'esercizio nell'array preallocato, nell'ordine di METRIC_FIELDS"""
+    if exercise_type == "squat" and len(keypoints) > 14:
+        hip_y = (keypoints[11][1] + keypoints[12][1]) / 2
+        knee_y = (keypoints[13][1] + keypoints[14][1]) / 2
+        out[0] = hip_y
+        out[1] = knee_y
+        out[2] = hip_y / knee_y if knee_y > 0 else 0
+        out[3] = abs(keypoints[13][0] - keypoints[14][0])
+
+    elif exercise_type == "pushup" and len(keypoints) > 8:
+        shoulder_y = (keypoints[5][1] + keypoints[6][1]) / 2
+        elbow_y = (keypoints[7][1] + keypoints[8][1]) / 2
+        out[0] = shoulder_y
+        out[1] = elbow_y
+        out[2] = elbow_y / shoulder_y if shoulder_y > 0 else 0
+
+    elif exercise_type == "bicep_curl" and len(keypoints) > 9:
+        out[0] = keypoints[7][1]
+        out[1] = keypoints[9][1]
+        out[2] = keypoints[7][1] - keypoints[9][1]
+        out[3] = abs(keypoints[7][0] - keypoints[5][0])
+
+    else:
+        return 0
+
+    return len(METRIC_FIELDS[exercise_type])
+
 def analyze_metrics(keypoints, confidence, exercise_type):
     """Estrae metriche dettagliate per UI"""
     if keypoints is None or confidence is None:
         return {}
 
     try:
-        metrics = {"exercise": exercise_type}
-
-        if exercise_type == "squat" and len(keypoints) > 14:
-            hip_y = (keypoints[11][1] + keypoints[12][1]) / 2
-            knee_y = (keypoints[13][1] + keypoints[14][1]) / 2
-
-            metrics.update({
-                "hip_y": float(hip_y),
-                "knee_y": float(knee_y),
-                "depth_ratio": float(hip_y / knee_y) if knee_y > 0 else 0,
-                "knee_alignment": float(abs(keypoints[13][0] - keypoints[14][0]))
-            })
-
-        elif exercise_type == "pushup" and len(keypoints) > 8:
-            shoulder_y = (keypoints[5][1] + keypoints[6][1]) / 2
-            elbow_y = (keypoints[7][1] + keypoints[8][1]) / 2
-
-            metrics.update({
-                "shoulder_y": float(shoulder_y),
-                "elbow_y": float(elbow_y),
-                "depth_ratio": float(elbow_y / shoulder_y) if shoulder_y > 0 else 0
-            })
-
-        elif exercise_type == "bicep_curl" and len(keypoints) > 9:
-            elbow_y = keypoints[7][1]
-            wrist_y = keypoints[9][1]
-
-            metrics.update({
-                "elbow_y": float(elbow_y),
-                "wrist_y": float(wrist_y),
-                "flexion_pixels": float(elbow_y - wrist_y),
-                "stability": float(abs(keypoints[7][0] - keypoints[5][0]))
-            })
+        import numpy as np
 
+        values = np.zeros(MAX_METRICS, dtype=np.float32)
+        count = compute_metrics_into(keypoints, exercise_type, values)
+        metrics = {"exercise": exercise_type}
+        metrics.update(zip(METRIC_FIELDS.get(exercise_type, ())[:count], map(float, values)))
         return metrics
 
     except Exception as e:
         return {"error": str(e)}
 
+# Conteggio ripetizioni: metrica, soglia fase bassa, soglia risalita, soglia "perfetto"
+REP_THRESHOLDS = {
+    "squat": ("depth_ratio", 1.03, 0.95, 1.08),
+    "pushup": ("depth_ratio", 1.05, 1.00, 1.12),
+    "bicep_curl": ("flexion_pixels", 30.0, 10.0, 60.0)
+}
+
+class RepCounter:
+    """Conta le ripetizioni con isteresi sulla metrica principale dell'esercizio"""
+
+    def __init__(self, exercise_type):
+        self.exercise_type = exercise_type
+        self.metric, self.enter, self.exit, self.excellent = REP_THRESHOLDS[exercise_type]
+        self.metric_index = METRIC_FIELDS[exercise_type].index(self.metric)
+        self.count = 0
+        self.in_rep = False
+        self.rep_start = 0.0
+        self.peak = 0.0
+
+    def update(self, value, timestamp):
+        """Aggiorna con la metrica del frame; restituisce il riepilogo rep se completata"""
+        if not self.in_rep:
+            if value > self.enter:
+                self.in_rep = True
+                self.rep_start = timestamp
+                self.peak = value
+            return None
+
+        self.peak = max(self.peak, value)
+        if value >= self.exit:
+            return None
+
+        self.in_rep = False
+        self.count += 1
+        return {
+            "rep_index": self.count,
+            "ts": timestamp,
+            "duration_s": timestamp - self.rep_start,
+            "metric": self.metric,
+            "peak": self.peak,
+            "status": "excellent" if self.peak > self.excellent else "good"
+        }
+
+class WorkoutStore:
+    """Storico allenamenti su SQLite (WAL): insert a batch da un thread writer dedicato"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS reps (
+            id INTEGER PRIMARY KEY,
+            athlete TEXT NOT NULL,
+            exercise TEXT NOT NULL,
+            set_id TEXT NOT NULL,
+            rep_index INTEGER NOT NULL,
+            ts REAL NOT NULL,
+            duration_s REAL,
+            metric TEXT,
+            peak REAL,
+            status TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_reps_athlete_exercise_ts
+            ON reps (athlete, exercise, ts, peak);
+        CREATE INDEX IF NOT EXISTS idx_reps_set ON reps (set_id);
+
+        CREATE TABLE IF NOT EXISTS sets (
+            set_id TEXT PRIMARY KEY,
+            athlete TEXT NOT NULL,
+            exercise TEXT NOT NULL,
+            started_ts REAL NOT NULL,
+            ended_ts REAL NOT NULL,
+            reps INTEGER NOT NULL,
+            avg_peak REAL,
+            best_peak REAL,
+            summary TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_sets_athlete_exercise_ts
+            ON sets (athlete, exercise, started_ts);
+
+        -- Rollup settimanale aggiornato ad ogni batch: le query per settimana
+        -- non scansionano le singole rep
+        CREATE TABLE IF NOT EXISTS reps_weekly (
+            athlete TEXT NOT NULL,
+            exercise TEXT NOT NULL,
+            week INTEGER NOT NULL,
+            peak_sum REAL NOT NULL,
+            rep_count INTEGER NOT NULL,
+            PRIMARY KEY (athlete, exercise, week)
+        ) WITHOUT ROWID;
+    """
+
+    # Epoch (giovedì) + 4 giorni = settimane che iniziano di lunedì
+    WEEK_SECONDS = 7 * 24 * 3600
+    WEEK_OFFSET = 4 * 24 * 3600
+
+    def __init__(self, path=DB_PATH, batch_size=500, flush_interval=1.0, max_pending=10000):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue = Queue(maxsize=max_pending)
+
+        conn = self._connect()
+        conn.executescript(self.SCHEMA)
+        conn.close()
+
+        self._writer_thread = threading.Thread(target=self._writer, name="workout-store", daemon=True)
+        self._writer_thread.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _week(self, ts):
+        return int((ts - self.WEEK_OFFSET) // self.WEEK_SECONDS)
+
+    def _enqueue(self, item):
+        """Mai bloccante: se il writer è indietro la rep viene scartata e contata"""
+        try:
+            self._queue.put_nowait(item)
+        except Full:
+            self.dropped += 1
+
+    def record_rep(self, athlete, exercise, set_id, rep):
+        self._enqueue(("rep", (
+            athlete, exercise, set_id, rep["rep_index"], rep["ts"], rep["duration_s"],
+            rep["metric"], rep["peak"], rep["status"]
+        )))
+
+    def record_set(self, athlete, exercise, set_id, summary):
+        self._enqueue(("set", (
+            set_id, athlete, exercise, summary["started_ts"], summary["ended_ts"],
+            summary["reps"], summary.get("avg_peak"), summary.get("best_peak"),
+            json.dumps(summary)
+        )))
+
+    def flush(self):
+        """Attende che tutti i record in coda siano scritti"""
+        self._queue.join()
+
+    def close(self):
+        self.flush()
+        self._queue.put(None)
+        self._writer_thread.join()
+
+    def _writer(self):
+        conn = self._connect()
+        while True:
+            batch = []
+            try:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get_nowait())
+            except Empty:
+                pass
+            if not batch:
+                continue
+
+            stop = None in batch
+            try:
+                self._write_batch(conn, [item for item in batch if item is not None])
+            except sqlite3.Error as e:
+                print(f"Errore scrittura storico: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                conn.close()
+                return
+
+    def _write_batch(self, conn, batch):
+        reps = [row for kind, row in batch if kind == "rep"]
+        sets = [row for kind, row in batch if kind == "set"]
+
+        weekly = {}
+        for athlete, exercise, _, _, ts, _, _, peak, _ in reps:
+            key = (athlete, exercise, self._week(ts))
+            peak_sum, count = weekly.get(key, (0.0, 0))
+            weekly[key] = (peak_sum + peak, count + 1)
+
+        with conn:
+            conn.executemany(
+                "INSERT INTO reps (athlete, exercise, set_id, rep_index, ts, duration_s, metric, peak, status) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", reps
+            )
+            conn.executemany(
+                "INSERT INTO reps_weekly (athlete, exercise, week, peak_sum, rep_count) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (athlete, exercise, week) DO UPDATE SET "
+                "peak_sum = peak_sum + excluded.peak_sum, rep_count = rep_count + excluded.rep_count",
+                [key + value for key, value in weekly.items()]
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO sets (set_id, athlete, exercise, started_ts, ended_ts, reps, avg_peak, best_peak, summary) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", sets
+            )
+
+    def weekly_average(self, athlete, exercise, weeks=52):
+        """Media settimanale del picco per rep (es. profondità squat) delle ultime N settimane"""
+        since_week = self._week(time.time()) - weeks + 1
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT week, peak_sum / rep_count, rep_count FROM reps_weekly "
+                "WHERE athlete = ? AND exercise = ? AND week >= ? ORDER BY week",
+                (athlete, exercise, since_week)
+            ).fetchall()
+        finally:
+            conn.close()
+        return [
+            {"week_start": week * self.WEEK_SECONDS + self.WEEK_OFFSET, "avg_peak": avg, "reps": count}
+            for week, avg, count in rows
+        ]
+
+    def recent_sets(self, athlete, exercise=None, limit=10):
+        """Ultimi set registrati per l'atleta"""
+        query = "SELECT set_id, exercise, started_ts, ended_ts, reps, avg_peak, best_peak FROM sets WHERE athlete = ?"
+        params = [athlete]
+        if exercise:
+            query += " AND exercise = ?"
+            params.append(exercise)
+        query += " ORDER BY started_ts DESC LIMIT ?"
+        params.append(limit)
+
+        conn = self._connect()
+        try:
+            rows = conn.execute(query, params).fetchall()
+        finally:
+            conn.close()
+        keys = ("set_id", "exercise", "started_ts", "ended_ts", "reps", "avg_peak", "best_peak")
+        return [dict(zip(keys, row)) for row in rows]
+
+@st.cache_resource(show_spinner=False)
+def get_workout_store(path=DB_PATH):
+    """Store condiviso da tutte le sessioni (un solo writer SQLite)"""
+    return WorkoutStore(path)
+
+# Stati in cui l'analyzer ha davvero valutato il frame (non fermo, non da riposizionare, non errore)
+ANALYZED_STATUSES = ("excellent", "good", "poor")
+# Metrica di allineamento monitorata per il drift durante il set
+ALIGNMENT_FIELDS = {"squat": "knee_alignment", "bicep_curl": "stability"}
+ALIGNMENT_BASELINE_FRAMES = 10
+ALIGNMENT_EWMA_ALPHA = 0.1
+# Coefficiente di variazione dei picchi oltre cui la consistenza è 0
+CONSISTENCY_CV_LIMIT = 0.2
+
+class RunningStats:
+    """Media e varianza di Welford + min/max in memoria O(1)"""
+
+    __slots__ = ("count", "mean", "_m2", "min", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def std(self):
+        return math.sqrt(self._m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def to_dict(self):
+        if not self.count:
+            return {"count": 0, "mean": None, "std": None, "min": None, "max": None}
+        return {"count": self.count, "mean": self.mean, "std": self.std, "min": self.min, "max": self.max}
+
+class RunningTrend:
+    """Pendenza ai minimi quadrati di y rispetto a x, aggiornata incrementalmente"""
+
+    __slots__ = ("n", "sx", "sy", "sxx", "sxy")
+
+    def __init__(self):
+        self.n = 0
+        self.sx = self.sy = self.sxx = self.sxy = 0.0
+
+    def add(self, x, y):
+        self.n += 1
+        self.sx += x
+        self.sy += y
+        self.sxx += x * x
+        self.sxy += x * y
+
+    @property
+    def slope(self):
+        denominator = self.n * self.sxx - self.sx * self.sx
+        if self.n < 2 or denominator == 0:
+            return 0.0
+        return (self.n * self.sxy - self.sx * self.sy) / denominator
+
+class SetAggregator:
+    """Statistiche del set in streaming: nessuna storia per-frame o per-rep in memoria"""
+
+    def __init__(self, exercise_type, started_ts=None):
+        self.exercise_type = exercise_type
+        self.metric_name = REP_THRESHOLDS[exercise_type][0]
+        self.metric_index = METRIC_FIELDS[exercise_type].index(self.metric_name)
+        alignment_field = ALIGNMENT_FIELDS.get(exercise_type)
+        self.alignment_index = METRIC_FIELDS[exercise_type].index(alignment_field) if alignment_field else None
+
+        self.started_ts = started_ts or time.time()
+        self.ended_ts = self.started_ts
+        self.metric = RunningStats()
+        self.alignment = RunningStats()
+        self.alignment_baseline = RunningStats()
+        self.alignment_ewma = 0.0
+        self.rep_peaks = RunningStats()
+        self.rep_durations = RunningStats()
+        self.peak_trend = RunningTrend()
+        self.duration_trend = RunningTrend()
+
+    def add_frame(self, metrics, timestamp):
+        """Aggiorna con le metriche (array METRIC_FIELDS) di un frame analizzato"""
+        self.ended_ts = timestamp
+        self.metric.add(float(metrics[self.metric_index]))
+
+        if self.alignment_index is not None:
+            alignment = float(metrics[self.alignment_index])
+            self.alignment.add(alignment)
+            if self.alignment_baseline.count < ALIGNMENT_BASELINE_FRAMES:
+                self.alignment_baseline.add(alignment)
+                self.alignment_ewma = self.alignment_baseline.mean
+            else:
+                self.alignment_ewma += ALIGNMENT_EWMA_ALPHA * (alignment - self.alignment_ewma)
+
+    def add_rep(self, rep):
+        """Aggiorna con il riepilogo di una rep completata (RepCounter)"""
+        self.rep_peaks.add(rep["peak"])
+        self.rep_durations.add(rep["duration_s"])
+        self.peak_trend.add(rep["rep_index"], rep["peak"])
+        self.duration_trend.add(rep["rep_index"], rep["duration_s"])
+
+    @property
+    def alignment_drift(self):
+        """Allineamento attuale (EWMA) meno quello di inizio set, in pixel"""
+        if self.alignment_baseline.count < ALIGNMENT_BASELINE_FRAMES:
+            return 0.0
+        return self.alignment_ewma - self.alignment_baseline.mean
+
+    @property
+    def consistency_score(self):
+        """0-100: quanto sono simili tra loro i picchi delle rep (None con meno di 2 rep)"""
+        if self.rep_peaks.count < 2 or self.rep_peaks.mean == 0:
+            return None
+        cv = self.rep_peaks.std / abs(self.rep_peaks.mean)
+        return 100 * max(0.0, 1 - cv / CONSISTENCY_CV_LIMIT)
+
+    @property
+    def fatigue(self):
+        """Rep sempre meno profonde e più lente lungo il set"""
+        return self.rep_peaks.count >= 4 and self.peak_trend.slope < 0 and self.duration_trend.slope > 0
+
+    def summary(self):
+        """Riepilogo del set (monitor, export e storico)"""
+        return {
+            "exercise": self.exercise_type,
+            "started_ts": self.started_ts,
+            "ended_ts": self.ended_ts,
+            "reps": self.rep_peaks.count,
+            "avg_peak": self.rep_peaks.mean if self.rep_peaks.count else None,
+            "best_peak": self.rep_peaks.max if self.rep_peaks.count else None,
+            "metric": self.metric_name,
+            "frames": self.metric.to_dict(),
+            "rep_peaks": self.rep_peaks.to_dict(),
+            "rep_durations_s": self.rep_durations.to_dict(),
+            "alignment": self.alignment.to_dict() if self.alignment_index is not None else None,
+            "alignment_drift_px": self.alignment_drift,
+            "peak_trend_per_rep": self.peak_trend.slope,
+            "duration_trend_s_per_rep": self.duration_trend.slope,
+            "fatigue": self.fatigue,
+            "consistency_score": self.consistency_score
+        }
+
 def main():
     st.set_page_config(
         page_title="💪 Fitness AI - STREAMING REALE COMPLETO",
@@ -307,8 +1636,8 @@ def main():
     # Session state
     if 'model' not in st.session_state:
         st.session_state.model = None
-    if 'processing_thread' not in st.session_state:
-        st.session_state.processing_thread = None
+    if 'supervisor' not in st.session_state:
+        st.session_state.supervisor = None
     if 'system_running' not in st.session_state:
         st.session_state.system_running = False
     if 'last_result' not in st.session_state:
@@ -319,15 +1648,36 @@ def main():
     # Sidebar
     st.sidebar.header("🚀 Sistema Real-Time Completo")
 
-    # Carica YOLO11
+    # Carica YOLO11 (preload in background oppure su richiesta)
+    preloader = get_model_preloader(MODEL_WEIGHTS) if PRELOAD_MODEL else None
+
     if not st.session_state.model:
-        if st.sidebar.button("🤖 CARICA YOLO11 STREAMING", type="primary"):
+        if preloader and preloader.ready:
+            st.session_state.model = preloader.model
+        elif preloader and preloader.state == "loading":
+            with st.sidebar:
+                model_readiness_indicator(preloader)
+        elif st.sidebar.button("🤖 CARICA YOLO11 STREAMING", type="primary"):
+            if preloader:
+                # Retry dopo errore del preload
+                preloader.start()
+                st.rerun()
             st.session_state.model = load_yolo_model()
             if st.session_state.model:
                 st.sidebar.success("✅ YOLO11 STREAMING Ready!")
                 st.rerun()
-    else:
+        elif preloader and preloader.state == "error":
+            st.sidebar.error(f"❌ Preload YOLO11 fallito: {preloader.error}")
+
+    if st.session_state.model:
         st.sidebar.success("🤖 YOLO11 STREAMING ✅")
+        if preloader and preloader.timings:
+            st.sidebar.caption(
+                f"⏱️ Import {preloader.timings['import_s']:.1f}s · "
+                f"Load {preloader.timings['load_s']:.1f}s · "
+                f"Warm-up {preloader.timings['warmup_s']:.1f}s"
+                + (f" · Worker {preloader.timings['worker_s']:.1f}s" if 'worker_s' in preloader.timings else "")
+            )
 
     # Controlli
     exercise_type = st.sidebar.selectbox(
@@ -336,9 +1686,66 @@ def main():
         format_func=lambda x: {"squat": "🏋️ Squat", "pushup": "💪 Push-up", "bicep_curl": "🏋️‍♀️ Curl"}[x]
     )
 
+    athlete = st.sidebar.text_input("👤 Atleta", value="default").strip() or "default"
     speech_enabled = st.sidebar.checkbox("🔊 Feedback Vocale", value=True)
     frame_rate = st.sidebar.slider("📹 Frame Rate", 1, 10, 3, help="Frame al secondo per analisi")
     movement_threshold = st.sidebar.slider("📈 Soglia Movimento", 10, 50, 20, help="Pixel minimo movimento")
+    confidence_gate = st.sidebar.slider(
+        "🎯 Gate Confidenza", 0.3, 0.9, CONFIDENCE_GATE, 0.05,
+        help="Confidenza minima delle articolazioni chiave per l'analisi (sotto: escalation)"
+    )
+    keypoint_conf_min = st.sidebar.slider(
+        "👁️ Confidenza Keypoint", 0.2, 0.8, KEYPOINT_CONF_MIN, 0.05,
+        help="Keypoint visibili per movimento e overlay"
+    )
+    live_settings = {
+        "exercise_type": exercise_type, "movement_threshold": movement_threshold,
+        "confidence_gate": confidence_gate, "keypoint_conf_min": keypoint_conf_min
+    }
+
+    # Pipeline attiva: le modifiche vanno al worker senza riavviarlo
+    supervisor = st.session_state.supervisor
+    if supervisor is not None and supervisor.state != "stopped" and supervisor.processor.control is not None:
+        if supervisor.processor.control.update(**live_settings):
+            st.sidebar.caption("🔀 Impostazioni applicate dal prossimo frame")
+
+    escalation_rate = st.sidebar.slider(
+        "🔬 Escalation max/s", 0.0, 5.0, ESCALATION_MAX_RATE, 0.5,
+        help="Frame incerti rianalizzati con modello più grande (0 = solo nano)"
+    )
+
+    # Runtime CPU: thread torch/OpenCV e pinning dei worker
+    available_cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count() or 1))
+    with st.sidebar.expander("⚙️ Runtime CPU"):
+        torch_threads = st.number_input(
+            "Thread intra-op torch", 0, len(available_cpus), min(RUNTIME_DEFAULTS["torch_threads"], len(available_cpus)),
+            help="0 = default torch"
+        )
+        # L'inter-op pool di torch si fissa alla prima inference (il preload): solo da env
+        st.caption("Thread inter-op torch: solo via `FITNESS_TORCH_INTEROP_THREADS` (fissati al preload)")
+        cv2_threads = st.number_input(
+            "Thread OpenCV", -1, len(available_cpus), min(RUNTIME_DEFAULTS["cv2_threads"], len(available_cpus)),
+            help="-1 = default OpenCV, 0 = disabilita il threading"
+        )
+        cpu_affinity = st.text_input(
+            "CPU affinity", RUNTIME_DEFAULTS["cpu_affinity"],
+            help="Core usabili dai worker, es. '0-3,6' (vuoto = nessun pinning)"
+        )
+        cpus_per_worker = st.number_input(
+            "Core per worker", 0, len(available_cpus), min(RUNTIME_DEFAULTS["cpus_per_worker"], len(available_cpus)),
+            help="0 = ogni worker usa tutti i core dell'affinity"
+        )
+        try:
+            cpus = parse_cpu_list(cpu_affinity)
+        except ValueError:
+            st.error(f"❌ CPU affinity non valida: {cpu_affinity}")
+            cpus = []
+        if 'runtime_config' in st.session_state:
+            cfg = st.session_state.runtime_config
+            st.caption(
+                f"Effettivi: torch {cfg['torch_threads']}/{cfg['torch_interop_threads']} · "
+                f"OpenCV {cfg['cv2_threads']} · CPU {cfg.get('cpu_set') or 'tutte'}"
+            )
 
     # Sistema controls
     col1, col2 = st.sidebar.columns(2)
@@ -346,26 +1753,46 @@ def main():
     with col1:
         if st.button("▶️ START SISTEMA", type="primary", disabled=not st.session_state.model):
             st.session_state.system_running = True
-            if st.session_state.model and not st.session_state.processing_thread:
-                st.session_state.processing_thread = threading.Thread(
-                    target=process_frame_queue,
-                    args=(st.session_state.model, exercise_type),
-                    daemon=True
+            supervisor = st.session_state.supervisor
+            if st.session_state.model and (supervisor is None or supervisor.state == "stopped"):
+                cpu_set = worker_cpu_set(cpus, cpus_per_worker, next(get_worker_counter()))
+                st.session_state.runtime_config = dict(
+                    configure_runtime_threads(torch_threads, cv2_threads=cv2_threads),
+                    cpu_set=cpu_set
                 )
-                st.session_state.processing_thread.start()
+                with st.spinner("🤖 Istanza YOLO11 dedicata al worker..."):
+                    # Dal preload: istanza già pronta in background, caricata qui solo se esaurita
+                    worker_model = preloader.take_worker_model() if preloader else create_worker_model(MODEL_WEIGHTS)
+                cascade = PoseCascade(
+                    worker_model,
+                    get_escalation_preloader() if ESCALATION_MODEL else None,
+                    max_rate=escalation_rate
+                )
+                processor = FrameProcessor(
+                    cascade, exercise_type, athlete, get_workout_store(),
+                    control=PipelineControl(**live_settings)
+                )
+                st.session_state.supervisor = WorkerSupervisor(
+                    worker_model, exercise_type, processor, cpu_set, athlete, get_workout_store(), cascade,
+                    model_factory=preloader.take_worker_model if preloader else lambda: create_worker_model(MODEL_WEIGHTS)
+                ).start()
             st.rerun()
 
     with col2:
         if st.button("⏹️ STOP", type="secondary"):
             st.session_state.system_running = False
-            frame_queue.put(None)  # Signal to stop
-            st.session_state.processing_thread = None
+            if st.session_state.supervisor is not None:
+                st.session_state.supervisor.stop()  # Signal to stop
             st.rerun()
 
     # Stats
     st.sidebar.subheader("📊 Real-Time Stats")
     st.sidebar.metric("📹 Frame Processati", st.session_state.total_frames)
-    st.sidebar.metric("🔄 Sistema", "🟢 ATTIVO" if st.session_state.system_running else "⚪ FERMO")
+    if st.session_state.system_running and st.session_state.supervisor is not None:
+        with st.sidebar:
+            worker_health_indicator(st.session_state.supervisor)
+    else:
+        st.sidebar.metric("🔄 Sistema", "⚪ FERMO")
 
     # Test
     if st.sidebar.button("🔊 Test Sistema"):
@@ -450,6 +1877,9 @@ def main():
                     const exerciseType = '{exercise_type}';
                     const speechEnabled = {str(speech_enabled).lower()};
                     const frameRate = {frame_rate};
+                    const modelInputSize = {MODEL_INPUT_SIZE};
+                    const modelStride = {MODEL_STRIDE};
+                    let bytesSent = 0;
 
                     async function initializeSystem() {{
                         try {{
@@ -470,8 +1900,10 @@ def main():
                             // Setup canvas
                             overlay.width = video.videoWidth;
                             overlay.height = video.videoHeight;
-                            captureCanvas.width = video.videoWidth;
-                            captureCanvas.height = video.videoHeight;
+                            // Capture canvas = input del modello (letterbox), non il frame intero
+                            const scale = Math.min(modelInputSize / video.videoWidth, modelInputSize / video.videoHeight);
+                            captureCanvas.width = Math.ceil(Math.round(video.videoWidth * scale) / modelStride) * modelStride;
+                            captureCanvas.height = Math.ceil(Math.round(video.videoHeight * scale) / modelStride) * modelStride;
 
                             document.getElementById('statusMessage').innerHTML = '✅ SISTEMA COMPLETO ATTIVO - YOLO11 Real-Time Processing!';
 
@@ -502,25 +1934,46 @@ def main():
                         try {{
                             frameCounter++;
 
-                            // Cattura frame corrente
-                            captureCtx.drawImage(video, 0, 0);
+                            // Cattura frame corrente già in letterbox per il modello
+                            const meta = letterboxFrame();
                             const imageData = captureCanvas.toDataURL('image/jpeg', 0.8);
+                            const payload = JSON.stringify({{ image: imageData, meta: meta }});
+                            bytesSent += payload.length;
 
                             // Invia frame per processing YOLO11 (simulazione)
-                            // In implementazione reale: WebSocket/API call
+                            // In implementazione reale: WebSocket/API call con `payload`
 
                             // Simula processing results per demo
                             const mockResult = generateRealisticResults();
                             processAnalysisResult(mockResult);
 
                             document.getElementById('frameInfo').innerHTML = 
-                                `📹 Frame: ${{frameCounter}} | 🎯 Keypoints: ${{currentKeypoints.length}}`;
+                                `📹 Frame: ${{frameCounter}} | 🎯 Keypoints: ${{currentKeypoints.length}} | ` +
+                                `📦 ${{(bytesSent / frameCounter / 1024).toFixed(1)}} KB/frame`;
 
                         }} catch (error) {{
                             console.error('Frame capture error:', error);
                         }}
                     }}
 
+                    function letterboxFrame() {{
+                        // Resize (lato lungo = modelInputSize) + padding grigio centrato, come il letterbox YOLO
+                        const srcW = video.videoWidth;
+                        const srcH = video.videoHeight;
+                        const scale = Math.min(modelInputSize / srcW, modelInputSize / srcH);
+                        const w = Math.round(srcW * scale);
+                        const h = Math.round(srcH * scale);
+                        const padX = Math.floor((captureCanvas.width - w) / 2);
+                        const padY = Math.floor((captureCanvas.height - h) / 2);
+
+                        captureCtx.fillStyle = 'rgb(114, 114, 114)';
+                        captureCtx.fillRect(0, 0, captureCanvas.width, captureCanvas.height);
+                        captureCtx.drawImage(video, 0, 0, srcW, srcH, padX, padY, w, h);
+
+                        // Il server usa scale/pad per riportare i keypoints in coordinate display
+                        return {{ scale: scale, pad_x: padX, pad_y: padY, src_w: srcW, src_h: srcH, ts: Date.now() / 1000 }};
+                    }}
+
                     function generateRealisticResults() {{
                         // Simula risultati YOLO11 realistici con movimento
                         const w = overlay.width;
@@ -739,7 +2192,7 @@ def main():
             # Monitor real-time results
             if not analysis_results.empty():
                 result = analysis_results.get()
-                st.session_state.last_result = result
+                st.session_state.last_result = result.to_dict()
                 st.session_state.total_frames += 1
 
             if st.session_state.last_result:
@@ -769,7 +2222,8 @@ def main():
                 if analysis_data:
                     st.subheader("📐 Metriche Real-Time")
 
-                    if exercise_type == 'squat':
+                    result_exercise = analysis_data.get('exercise', exercise_type)
+                    if result_exercise == 'squat':
                         col1, col2 = st.columns(2)
                         with col1:
                             st.metric("Hip Y", f"{analysis_data.get('hip_y', 0):.0f}px")
@@ -778,7 +2232,7 @@ def main():
                             st.metric("Knee Y", f"{analysis_data.get('knee_y', 0):.0f}px")
                             st.metric("Alignment", f"{analysis_data.get('knee_alignment', 0):.0f}px")
 
-                    elif exercise_type == 'pushup':
+                    elif result_exercise == 'pushup':
                         col1, col2 = st.columns(2)
                         with col1:
                             st.metric("Shoulder Y", f"{analysis_data.get('shoulder_y', 0):.0f}px")
@@ -786,7 +2240,7 @@ def main():
                         with col2:
                             st.metric("Elbow Y", f"{analysis_data.get('elbow_y', 0):.0f}px")
 
-                    elif exercise_type == 'bicep_curl':
+                    elif result_exercise == 'bicep_curl':
                         col1, col2 = st.columns(2)
                         with col1:
                             st.metric("Elbow Y", f"{analysis_data.get('elbow_y', 0):.0f}px")
@@ -798,11 +2252,55 @@ def main():
                 # Keypoints info
                 keypoints_count = len(result.get('keypoints', []))
                 st.metric("🎯 Keypoints", keypoints_count)
+                st.metric("🔁 Ripetizioni", result.get('reps', 0))
+
+                # Cascade nano -> escalation
+                # Dal processor corrente: dopo un handover la cascade è nuova (con i contatori riportati)
+                supervisor = st.session_state.supervisor
+                cascade = supervisor.processor.cascade if supervisor is not None else None
+                if cascade is not None and cascade.frames:
+                    cascade_stats = cascade.stats()
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        st.metric("🔬 Escalation", f"{cascade_stats['escalation_rate']:.0%}")
+                        st.metric("➕ Latenza", f"{cascade_stats['added_latency_ms_per_escalation']:.0f}ms")
+                    with col2:
+                        st.metric("🎯 Copertura", f"{cascade_stats['base_coverage']:.0%}",
+                                  delta=f"+{cascade_stats['coverage_gained']:.0%}")
+                        st.metric("⏳ Rate limited", cascade_stats['rate_limited'])
 
         else:
             st.info("📊 **Monitor in attesa...**")
             st.write("Avvia il sistema per vedere dati real-time")
 
+        # Statistiche del set (streaming, disponibili anche dopo STOP per l'export)
+        supervisor = st.session_state.supervisor
+        processor = supervisor.processor if supervisor is not None else None
+        if processor is not None and processor.set_stats.metric.count:
+            set_summary = processor.set_stats.summary()
+            st.subheader("📈 Statistiche Set")
+            col1, col2 = st.columns(2)
+            with col1:
+                frames_stats = set_summary['frames']
+                st.metric(set_summary['metric'], f"{frames_stats['mean']:.2f} ± {frames_stats['std']:.2f}")
+                st.metric("Min / Max", f"{frames_stats['min']:.2f} / {frames_stats['max']:.2f}")
+                if set_summary['alignment'] is not None:
+                    st.metric("Drift allineamento", f"{set_summary['alignment_drift_px']:+.0f}px")
+            with col2:
+                consistency = set_summary['consistency_score']
+                st.metric("Consistenza forma", f"{consistency:.0f}/100" if consistency is not None else "-")
+                st.metric("Trend picco/rep", f"{set_summary['peak_trend_per_rep']:+.3f}")
+                st.metric("Trend durata/rep", f"{set_summary['duration_trend_s_per_rep']:+.2f}s")
+            if set_summary['fatigue']:
+                st.warning("🥵 **Affaticamento**: rep meno profonde e più lente")
+
+            st.download_button(
+                "📥 Esporta set (JSON)",
+                data=json.dumps(dict(set_summary, athlete=athlete, set_id=processor.set_id), indent=2),
+                file_name=f"set_{processor.exercise_type}_{time.strftime('%Y%m%d_%H%M%S', time.localtime(set_summary['started_ts']))}.json",
+                mime="application/json"
+            )
+
         # Guida esercizio
         st.subheader("📋 Real-Time Guide")
 
@@ -838,6 +2336,27 @@ def main():
 
         st.info(guides[exercise_type])
 
+        # Storico persistente (SQLite)
+        with st.expander(f"📚 Storico {athlete}"):
+            store = get_workout_store()
+            weekly = store.weekly_average(athlete, exercise_type, weeks=12)
+            if weekly:
+                metric_name = REP_THRESHOLDS[exercise_type][0]
+                st.caption(f"Media settimanale {metric_name} (picco per rep)")
+                st.line_chart(
+                    [{"settimana": time.strftime('%Y-%m-%d', time.localtime(w['week_start'])), "media": w['avg_peak']}
+                     for w in weekly],
+                    x="settimana", y="media"
+                )
+                for workout_set in store.recent_sets(athlete, exercise_type, limit=5):
+                    st.write(
+                        f"🗓️ {time.strftime('%d/%m %H:%M', time.localtime(workout_set['started_ts']))} · "
+                        f"{workout_set['reps']} rep · media {workout_set['avg_peak'] or 0:.2f} · "
+                        f"best {workout_set['best_peak'] or 0:.2f}"
+                    )
+            else:
+                st.write("Nessuna ripetizione registrata per questo esercizio")
+
     # Footer
     if st.session_state.system_running:
         st.success("""
@@ -0,0 +1,789 @@
+"""
+Fitness Tracker AI - BENCHMARK
+Misure riproducibili per startup, pipeline e configurazione runtime.
+
+Uso:
+    python benchmark.py [--json out.json] startup
+    python benchmark.py [--json out.json] threads --workers 1,2,4
+    python benchmark.py [--json out.json] cascade --frames clip/ --exercise squat
+    python benchmark.py [--json out.json] alloc --frames 2000
+    python benchmark.py [--json out.json] payload --frames clip/
+    python benchmark.py load --clients 4 --fps 3 --frames clip/ [--baseline old.json]
+"""
+import argparse
+import array
+import base64
+import gc
+import json
+import math
+import os
+import re
+import resource
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from queue import Empty, Full, Queue
+
+# Moduli pesanti che non devono essere importati al primo render
+HEAVY_MODULES = ("torch", "ultralytics", "cv2", "numpy", "PIL")
+
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+def profile_imports(statement="import app"):
+    """Esegue `python -X importtime` e restituisce (self_us, cumulative_us, depth, module)"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr else "import fallito")
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append((int(self_us), int(cumulative_us), len(indent) // 2, module))
+    return rows
+
+def cmd_startup(args):
+    """Profilo di startup: costo import di app.py + time-to-first-inference"""
+    rows = profile_imports()
+    top_level = [r for r in rows if r[2] == 0]
+    total_ms = sum(r[1] for r in top_level) / 1000
+    # Quello che importa già streamlit non è imputabile ad app.py
+    baseline = {r[3].split(".")[0] for r in profile_imports("import streamlit")}
+    loaded = {r[3].split(".")[0] for r in rows}
+    heavy_loaded = [m for m in HEAVY_MODULES if m in loaded and m not in baseline]
+
+    print(f"📦 import app: {total_ms:.0f}ms (target {args.import_target_ms:.0f}ms)")
+    for self_us, cumulative_us, _, module in sorted(top_level, key=lambda r: -r[1])[:args.top]:
+        print(f"   {cumulative_us / 1000:8.1f}ms  {module}")
+    print(f"🪶 Moduli pesanti a import-time: {', '.join(heavy_loaded) or 'nessuno'}")
+
+    report = {
+        "import_ms": total_ms,
+        "import_target_ms": args.import_target_ms,
+        "heavy_modules_at_import": heavy_loaded,
+        "top_imports": [
+            {"module": m, "cumulative_ms": c / 1000, "self_ms": s / 1000}
+            for s, c, _, m in sorted(top_level, key=lambda r: -r[1])[:args.top]
+        ]
+    }
+    ok = total_ms <= args.import_target_ms and not heavy_loaded
+
+    if not args.skip_model:
+        app = _load_app()
+        import numpy as np
+
+        # Come l'app: preload (con istanza worker) + START + prima inference sull'istanza del worker
+        t0 = time.perf_counter()
+        preloader = app.ModelPreloader(args.weights, worker_spare=True).start()
+        preloader.wait()
+        if not preloader.ready:
+            raise SystemExit(f"❌ Preload fallito: {preloader.error}")
+        t1 = time.perf_counter()
+        worker_model = preloader.take_worker_model(refill=False)
+        worker_model(np.zeros((480, 640, 3), dtype=np.uint8), verbose=False, save=False)
+        first_inference_s = time.perf_counter() - t0
+        preloader.timings["start_s"] = time.perf_counter() - t1  # START -> prima inference del worker
+
+        print(f"🤖 time-to-first-inference: {first_inference_s:.2f}s "
+              f"(target {args.first_inference_target_s:.1f}s)")
+        for phase, seconds in preloader.timings.items():
+            print(f"   {phase:10s} {seconds:.2f}s")
+
+        report.update({
+            "first_inference_s": first_inference_s,
+            "first_inference_target_s": args.first_inference_target_s,
+            "model_timings": preloader.timings
+        })
+        ok = ok and first_inference_s <= args.first_inference_target_s
+
+    report["targets_met"] = ok
+    print("✅ Target rispettati" if ok else "❌ Target NON rispettati")
+    return report
+
+def _load_app():
+    """Importa app.py dalla cartella del benchmark"""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app
+    return app
+
+def _percentile(values, pct):
+    """Percentile nearest-rank (senza numpy)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def run_thread_config(weights, workers, torch_threads, interop_threads, cv2_threads, frames, pin):
+    """Un punto della sweep: N worker concorrenti, ognuno con la propria istanza YOLO come in app"""
+    app = _load_app()
+    import numpy as np
+    from ultralytics import YOLO
+
+    effective = app.configure_runtime_threads(torch_threads, interop_threads, cv2_threads)
+    frame = np.random.default_rng(0).integers(0, 255, (480, 640, 3), dtype=np.uint8)
+    # Un modello condiviso serializzerebbe i worker sul lock del predictor ultralytics
+    models = [YOLO(weights) for _ in range(workers)]
+    for model in models:
+        model(frame, verbose=False, save=False)  # warm-up
+
+    cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else []
+    cpus_per_worker = max(1, len(cpus) // workers) if pin else 0
+    latencies = [[] for _ in range(workers)]
+    barrier = threading.Barrier(workers + 1)
+
+    def worker(index):
+        if pin:
+            app.pin_current_thread(app.worker_cpu_set(cpus, cpus_per_worker, index))
+        barrier.wait()
+        for _ in range(frames):
+            t0 = time.perf_counter()
+            models[index](frame, verbose=False, save=False)
+            latencies[index].append(time.perf_counter() - t0)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(workers)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    t0 = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    all_latencies = [l for per_worker in latencies for l in per_worker]
+    return dict(effective, **{
+        "workers": workers,
+        "pinned": pin,
+        "throughput_fps": len(all_latencies) / elapsed,
+        "p50_ms": _percentile(all_latencies, 50) * 1000,
+        "p99_ms": _percentile(all_latencies, 99) * 1000
+    })
+
+def cmd_threads(args):
+    """Sweep thread torch/OpenCV x worker per trovare la config migliore sui core disponibili"""
+    if args.child:
+        result = run_thread_config(
+            args.weights, args.workers[0], args.torch_threads[0], args.interop_threads,
+            args.cv2_threads, args.frames, args.pin
+        )
+        print(json.dumps(result))
+        return result
+
+    cores = args.cores or (len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count())
+    thread_options = args.torch_threads or sorted({1, 2, 4, 8, cores} & set(range(1, cores + 1)))
+    results = []
+
+    print(f"🧵 Sweep su {cores} core: workers={args.workers} torch_threads={thread_options}")
+    for workers in args.workers:
+        for torch_threads in thread_options:
+            if workers * torch_threads > cores * args.oversubscribe:
+                continue
+            # Processo separato: set_num_interop_threads è impostabile una sola volta
+            cmd = [
+                sys.executable, os.path.abspath(__file__), "threads", "--child",
+                "--weights", args.weights, "--frames", str(args.frames),
+                "--workers", str(workers), "--torch-threads", str(torch_threads),
+                "--interop-threads", str(args.interop_threads), "--cv2-threads", str(args.cv2_threads)
+            ] + (["--pin"] if args.pin else [])
+            proc = subprocess.run(cmd, capture_output=True, text=True)
+            if proc.returncode != 0:
+                print(f"   ❌ workers={workers} threads={torch_threads}: {proc.stderr.strip()[-200:]}")
+                continue
+            result = json.loads(proc.stdout.strip().splitlines()[-1])
+            results.append(result)
+            print(f"   workers={workers:2d} threads={torch_threads:2d} "
+                  f"→ {result['throughput_fps']:6.1f} FPS  p50 {result['p50_ms']:6.1f}ms  p99 {result['p99_ms']:6.1f}ms")
+
+    if not results:
+        raise SystemExit("❌ Nessuna configurazione completata")
+
+    best = max(results, key=lambda r: r["throughput_fps"])
+    print(f"🏆 Migliore: FITNESS_TORCH_THREADS={best['torch_threads']} con {best['workers']} worker "
+          f"({best['throughput_fps']:.1f} FPS, p99 {best['p99_ms']:.0f}ms)")
+    if args.pin:
+        print(f"   FITNESS_CPUS_PER_WORKER={max(1, cores // best['workers'])}")
+    return {"cores": cores, "results": results, "best": best}
+
+def _jpeg_paths(path):
+    """File JPEG di una cartella (sequenza di frame) in ordine di nome"""
+    names = sorted(n for n in os.listdir(path) if n.lower().endswith((".jpg", ".jpeg")))
+    if not names:
+        raise SystemExit(f"❌ Nessun JPEG in {path}")
+    return [os.path.join(path, n) for n in names]
+
+def cmd_cascade(args):
+    """Replay di una sequenza JPEG nella cascade nano -> escalation e report"""
+    app = _load_app()
+    import cv2
+
+    model, _ = app.load_model_timed(args.weights)
+    escalation = (
+        app.ModelPreloader(args.escalation_model, configure_threads=False) if args.escalation_model else None
+    )
+    if escalation is not None:
+        escalation.start().wait()  # escluso dalla latenza misurata
+    cascade = app.PoseCascade(
+        model, escalation, imgsz=args.imgsz, gate=args.gate, max_rate=args.max_rate, fallback_weights=args.weights
+    )
+
+    # BGR come decode_frame dell'app (cv2.imdecode): lo stesso input che YOLO riceve in produzione
+    frames = [cv2.imread(p) for p in _jpeg_paths(args.frames)]
+    # Replay temporizzato: il rate limit dipende dal tempo reale tra i frame
+    interval = 1.0 / args.fps
+    t0 = time.perf_counter()
+    for index, frame in enumerate(frames):
+        delay = t0 + index * interval - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        cascade.infer(frame, args.exercise)
+
+    stats = cascade.stats()
+    print(f"🔬 Cascade {args.weights} -> {args.escalation_model or f'imgsz {args.imgsz}'} su {stats['frames']} frame")
+    print(f"   escalation: {stats['escalation_rate']:.1%} ({stats['escalations']}, rate limited {stats['rate_limited']}, "
+          f"non disponibile {stats['unavailable']})")
+    print(f"   latenza aggiunta: {stats['added_latency_ms_per_escalation']:.1f}ms/escalation, "
+          f"{stats['added_latency_ms_per_frame']:.1f}ms/frame")
+    print(f"   copertura analisi: {stats['base_coverage']:.1%} -> "
+          f"{stats['base_coverage'] + stats['coverage_gained']:.1%} (+{stats['coverage_gained']:.1%})")
+    return stats
+
+class SyntheticPoseModel:
+    """Modello finto con l'interfaccia dei risultati ultralytics: isola il percorso post-inference"""
+
+    class _Keypoints:
+        def __init__(self, xy, conf):
+            self.xy = xy
+            self.conf = conf
+
+    class _Result:
+        def __init__(self, keypoints):
+            self.keypoints = keypoints
+
+    def __init__(self, exercise="squat"):
+        import numpy as np
+
+        self.frame_index = 0
+        # Posa squat di base (coordinate 640x480) con hip/knee che oscillano
+        self.base = np.array([
+            [320, 70], [330, 62], [310, 62], [340, 70], [300, 70],
+            [270, 140], [370, 140], [250, 240], [390, 240], [230, 320], [410, 320],
+            [285, 290], [355, 290], [275, 390], [365, 390], [265, 470], [375, 470]
+        ], dtype=np.float32)
+        self.xy = np.zeros((1, 17, 2), dtype=np.float32)
+        self.conf = np.full((1, 17), 0.9, dtype=np.float32)
+        self.results = [self._Result(self._Keypoints(self.xy, self.conf))]
+
+    def __call__(self, frame, **kwargs):
+        import numpy as np
+
+        self.frame_index += 1
+        phase = np.sin(self.frame_index / 5.0)
+        np.copyto(self.xy[0], self.base)
+        self.xy[0, 11:13, 1] += 150 * phase  # hips
+        self.xy[0, 13:15, 1] += 20 * phase   # knees
+        return self.results
+
+def legacy_process(model, frame, exercise_type, previous_keypoints, app):
+    """Percorso per-frame pre-refactoring (dict e liste allocati ad ogni frame), per confronto"""
+    import numpy as np
+
+    results = model(frame, verbose=False, save=False)
+    keypoints = np.array(results[0].keypoints.xy[0])
+    confidence = np.array(results[0].keypoints.conf[0])
+
+    movement_detected = False
+    total_movement = 0
+    if previous_keypoints is not None and len(previous_keypoints) == len(keypoints):
+        for i in range(len(keypoints)):
+            if confidence is None or confidence[i] > 0.5:
+                dx = keypoints[i][0] - previous_keypoints[i][0]
+                dy = keypoints[i][1] - previous_keypoints[i][1]
+                total_movement += np.sqrt(dx*dx + dy*dy)
+        movement_detected = total_movement > 15
+
+    feedback_msg, voice_msg, status = app.analyze_exercise_real_time(
+        keypoints, confidence, exercise_type, movement_detected, total_movement
+    )
+    keypoints_list = [
+        {'id': i, 'x': float(kp[0]), 'y': float(kp[1]), 'conf': float(confidence[i])}
+        for i, kp in enumerate(keypoints) if confidence[i] > 0.5
+    ]
+    result = {
+        'timestamp': time.time(),
+        'keypoints': keypoints_list,
+        'feedback_msg': feedback_msg,
+        'voice_msg': voice_msg,
+        'status': status,
+        'movement_detected': movement_detected,
+        'total_movement': total_movement,
+        'analysis_data': app.analyze_metrics(keypoints, confidence, exercise_type)
+    }
+    return result, keypoints
+
+def _measure_allocations(step, frames, warmup):
+    """tracemalloc: picco transitorio per frame (inizio/fine run) e memoria trattenuta dal run"""
+    for _ in range(warmup):
+        step()
+
+    # Buffer dei campioni preallocato: non deve comparire tra i byte trattenuti
+    per_frame_peak = array.array('q', bytes(8 * frames))
+    gc.collect()
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    t0 = time.perf_counter()
+    for index in range(frames):
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        step()
+        per_frame_peak[index] = tracemalloc.get_traced_memory()[1] - current
+    elapsed = time.perf_counter() - t0
+    retained = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+
+    # Throughput misurato a parte: tracemalloc rallenta ogni allocazione
+    t1 = time.perf_counter()
+    for _ in range(frames):
+        step()
+    throughput = frames / (time.perf_counter() - t1)
+
+    window = max(1, frames // 10)
+    return {
+        "frames": frames,
+        "transient_bytes_per_frame": sum(per_frame_peak) / frames,
+        "transient_bytes_first_10pct": sum(per_frame_peak[:window]) / window,
+        "transient_bytes_last_10pct": sum(per_frame_peak[-window:]) / window,
+        "retained_bytes": retained,
+        "traced_seconds": elapsed,
+        "throughput_fps": throughput
+    }
+
+def cmd_alloc(args):
+    """Allocazioni per frame (tracemalloc) e throughput: percorso legacy vs buffer preallocati"""
+    app = _load_app()
+    import numpy as np
+
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+
+    legacy_model = SyntheticPoseModel()
+    legacy_state = {"previous": None}
+    legacy_results = Queue(maxsize=app.RESULTS_QUEUE_SIZE)
+
+    def legacy_step():
+        result, legacy_state["previous"] = legacy_process(
+            legacy_model, frame, args.exercise, legacy_state["previous"], app
+        )
+        if legacy_results.full():
+            legacy_results.get_nowait()  # la UI consuma i risultati
+        legacy_results.put_nowait(result)
+
+    processor = app.FrameProcessor(app.PoseCascade(SyntheticPoseModel(), max_rate=0), args.exercise)
+    ring_results = Queue(maxsize=app.RESULTS_QUEUE_SIZE)
+
+    def ring_step():
+        record = processor.process(frame)
+        if ring_results.full():
+            ring_results.get_nowait()
+        processor.publish(record, ring_results)
+
+    report = {}
+    for name, step in (("legacy", legacy_step), ("ring", ring_step)):
+        stats = _measure_allocations(step, args.frames, args.warmup)
+        report[name] = stats
+        print(f"🧠 {name:6s}: {stats['transient_bytes_per_frame']:8.0f} B/frame transitori "
+              f"({stats['transient_bytes_first_10pct']:.0f} -> {stats['transient_bytes_last_10pct']:.0f}), "
+              f"trattenuti {stats['retained_bytes']} B, "
+              f"{stats['throughput_fps']:.0f} FPS")
+
+    ring, legacy = report["ring"], report["legacy"]
+    flat = (
+        ring["retained_bytes"] <= args.max_retained_bytes
+        and ring["transient_bytes_last_10pct"] <= ring["transient_bytes_first_10pct"] * 1.1 + 64
+    )
+    # Anche il legacy è piatto: il refactor si misura contro il legacy, non in assoluto
+    reduction = 1 - ring["transient_bytes_per_frame"] / max(legacy["transient_bytes_per_frame"], 1)
+    below_legacy = reduction >= args.min_reduction and ring["retained_bytes"] <= legacy["retained_bytes"]
+    speedup = ring["throughput_fps"] / legacy["throughput_fps"]
+    print(f"⚡ Throughput ring/legacy: x{speedup:.2f}")
+    print(f"📉 Allocazioni ring vs legacy: -{reduction:.0%} B/frame "
+          f"(minimo richiesto -{args.min_reduction:.0%})")
+    print("✅ Allocazioni per frame costanti" if flat else "❌ Allocazioni per frame in crescita")
+    print("✅ Ring sotto il legacy" if below_legacy else "❌ Ring non sotto il legacy")
+    report.update({"speedup": speedup, "reduction": reduction, "targets_met": flat and below_legacy})
+    return report
+
+def _synthetic_display_frames(count, width, height):
+    """Frame display sintetici (gradiente + sagoma in movimento), compressibili come una scena reale"""
+    import cv2
+    import numpy as np
+
+    yy, xx = np.mgrid[0:height, 0:width]
+    background = np.dstack([(xx * 255 // width), (yy * 255 // height), ((xx + yy) * 127 // (width + height))]).astype(np.uint8)
+    frames = []
+    for index in range(count):
+        frame = background.copy()
+        cy = int(height * (0.5 + 0.15 * np.sin(index / 5.0)))
+        cv2.ellipse(frame, (width // 2, cy), (width // 10, height // 4), 0, 0, 360, (40, 80, 200), -1)
+        cv2.circle(frame, (width // 2, cy - height // 3), height // 14, (180, 160, 140), -1)
+        frames.append(frame)
+    return frames
+
+def letterbox_like_client(frame, size, stride):
+    """Replica lato Python di letterboxFrame(): resize lato lungo + padding al multiplo dello stride"""
+    import cv2
+    import numpy as np
+
+    src_h, src_w = frame.shape[:2]
+    scale = min(size / src_w, size / src_h)
+    w, h = round(src_w * scale), round(src_h * scale)
+    canvas_w, canvas_h = math.ceil(w / stride) * stride, math.ceil(h / stride) * stride
+    pad_x, pad_y = (canvas_w - w) // 2, (canvas_h - h) // 2
+
+    canvas = np.full((canvas_h, canvas_w, 3), 114, dtype=np.uint8)
+    canvas[pad_y:pad_y + h, pad_x:pad_x + w] = cv2.resize(frame, (w, h), interpolation=cv2.INTER_LINEAR)
+    return canvas, {"scale": scale, "pad_x": pad_x, "pad_y": pad_y, "src_w": src_w, "src_h": src_h}
+
+def _data_url(frame, quality):
+    import cv2
+
+    ok, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return "data:image/jpeg;base64," + base64.b64encode(jpeg.tobytes()).decode("ascii")
+
+def cmd_payload(args):
+    """Bytes/frame e CPU server per frame: frame intero vs letterbox lato client"""
+    app = _load_app()
+    import cv2
+    from ultralytics.data.augment import LetterBox
+
+    if args.frames:
+        frames = [cv2.imread(p) for p in _jpeg_paths(args.frames)]
+    else:
+        frames = _synthetic_display_frames(args.count, args.width, args.height)
+
+    # Stessi payload che produrrebbe il browser (JPEG qualità 0.8)
+    legacy_payloads = [_data_url(f, args.quality) for f in frames]
+    client_payloads = []
+    for frame in frames:
+        canvas, meta = letterbox_like_client(frame, app.MODEL_INPUT_SIZE, app.MODEL_STRIDE)
+        client_payloads.append(json.dumps({"image": _data_url(canvas, args.quality), "meta": meta}))
+
+    # Pre-processing server come nel predictor YOLO (letterbox auto, stride 32)
+    letterbox = LetterBox(new_shape=(app.MODEL_INPUT_SIZE, app.MODEL_INPUT_SIZE), auto=True, stride=app.MODEL_STRIDE)
+
+    def server_cpu(payloads):
+        t0 = time.process_time()
+        for _ in range(args.repeat):
+            for payload in payloads:
+                frame_array, _ = app.decode_frame_payload(payload)
+                letterbox(image=frame_array)
+        return (time.process_time() - t0) / (args.repeat * len(payloads))
+
+    report = {}
+    for name, payloads in (("full_frame", legacy_payloads), ("client_letterbox", client_payloads)):
+        report[name] = {
+            "bytes_per_frame": sum(len(p) for p in payloads) / len(payloads),
+            "server_cpu_ms_per_frame": server_cpu(payloads) * 1000
+        }
+        print(f"📦 {name:16s}: {report[name]['bytes_per_frame'] / 1024:7.1f} KB/frame, "
+              f"CPU server {report[name]['server_cpu_ms_per_frame']:.2f} ms/frame")
+
+    before, after = report["full_frame"], report["client_letterbox"]
+    report["bytes_reduction"] = 1 - after["bytes_per_frame"] / before["bytes_per_frame"]
+    report["server_cpu_reduction"] = 1 - after["server_cpu_ms_per_frame"] / before["server_cpu_ms_per_frame"]
+    print(f"📉 Bytes -{report['bytes_reduction']:.0%}, CPU server -{report['server_cpu_reduction']:.0%}")
+    return report
+
+def _git_commit():
+    """Commit corrente (per confrontare i risultati tra commit)"""
+    proc = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    return proc.stdout.strip() or "unknown"
+
+def _rss_bytes():
+    """RSS corrente del processo (Linux /proc, fallback al picco getrusage)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def _client_payload_template(frame, app, quality):
+    """Payload client pre-codificato: per ogni invio cambia solo il timestamp di cattura"""
+    canvas, meta = letterbox_like_client(frame, app.MODEL_INPUT_SIZE, app.MODEL_STRIDE)
+    head = json.dumps({"image": _data_url(canvas, quality), "meta": meta})[:-2] + ', "ts": '
+    return head, "}}"
+
+def cmd_load(args):
+    """N client simulati a FPS fissi nel percorso reale di ingestion (process_frame_queue + analyzer)"""
+    app = _load_app()
+    import cv2
+
+    if args.model == "synthetic":
+        models = [SyntheticPoseModel() for _ in range(args.clients)]
+    else:
+        # Un'istanza per client come i worker dell'app: nessuna serializzazione sul predictor condiviso
+        app.load_model_timed(args.weights)
+        models = [app.create_worker_model(args.weights) for _ in range(args.clients)]
+
+    if args.frames:
+        frames = [cv2.imread(p) for p in _jpeg_paths(args.frames)]
+    else:
+        frames = _synthetic_display_frames(args.count, args.width, args.height)
+    templates = [_client_payload_template(f, app, args.quality) for f in frames]
+
+    latency_window = int(args.fps * (args.duration + 5)) + 16
+    clients = []
+    for index in range(args.clients):
+        client = {
+            "input": Queue(maxsize=10),
+            "output": Queue(maxsize=app.RESULTS_QUEUE_SIZE),
+            "model": models[index],
+            "processor": app.FrameProcessor(
+                app.PoseCascade(models[index], max_rate=args.escalation_rate), args.exercise,
+                latency_window=latency_window
+            ),
+            "sent": 0,
+            "ingest_dropped": 0,
+            "results": 0,
+            "worker_cpu_s": 0.0
+        }
+        clients.append(client)
+
+    stop = threading.Event()
+    drained = threading.Event()  # worker terminati: i consumer possono chiudere
+
+    def worker(client):
+        t0 = time.thread_time()
+        app.process_frame_queue(
+            client["model"], args.exercise, input_queue=client["input"], output_queue=client["output"],
+            processor=client["processor"]
+        )
+        # Decode nel thread del worker + inference/analisi nel thread di inference
+        client["worker_cpu_s"] = time.thread_time() - t0 + client["processor"].cpu_seconds
+
+    def producer(client, offset):
+        interval = 1.0 / args.fps
+        next_send = time.perf_counter() + offset
+        frame_index = 0
+        while not stop.is_set():
+            delay = next_send - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            head, tail = templates[frame_index % len(templates)]
+            frame_index += 1
+            next_send += interval
+            client["sent"] += 1
+            try:
+                client["input"].put_nowait(head + repr(time.time()) + tail)
+            except Full:
+                client["ingest_dropped"] += 1  # il server non tiene il passo
+
+    def consumer(client):
+        # Simula la UI che consuma i risultati
+        while not drained.is_set() or not client["output"].empty():
+            try:
+                client["output"].get(timeout=0.1)
+                client["results"] += 1
+            except Empty:
+                pass
+
+    rss_before = _rss_bytes()
+    cpu_before = time.process_time()
+    threads = []
+    for index, client in enumerate(clients):
+        # Client sfasati nel periodo, come stazioni indipendenti
+        offset = index / (args.fps * len(clients))
+        for target, extra in ((worker, ()), (producer, (offset,)), (consumer, ())):
+            t = threading.Thread(target=target, args=(client,) + extra, daemon=True)
+            t.start()
+            threads.append((target, t))
+
+    print(f"🏋️ {args.clients} client x {args.fps} FPS per {args.duration:.0f}s ({args.model})...")
+    t0 = time.perf_counter()
+    time.sleep(args.duration)
+    stop.set()
+    for target, t in threads:
+        if target is producer:
+            t.join()
+    for client in clients:
+        client["input"].put(None)  # stop worker dopo aver svuotato la coda
+    for target, t in threads:
+        if target is worker:
+            t.join()
+    # Solo ora: un consumer chiuso prima farebbe contare come scartati risultati già processati
+    drained.set()
+    for target, t in threads:
+        if target is consumer:
+            t.join()
+    elapsed = time.perf_counter() - t0
+    cpu_s = time.process_time() - cpu_before
+    rss_after = _rss_bytes()
+
+    per_client = []
+    all_latencies = []
+    for client in clients:
+        processor = client["processor"]
+        latencies = processor.latency_samples()
+        all_latencies.extend(latencies)
+        sent = max(client["sent"], 1)
+        per_client.append({
+            "sent": client["sent"],
+            "processed": processor.frames,
+            "analyzed": processor.frames - processor.no_person,
+            "throughput_fps": processor.frames / elapsed,
+            "drop_rate": (client["ingest_dropped"] + processor.dropped) / sent,
+            "p50_ms": _percentile(latencies, 50) * 1000,
+            "p99_ms": _percentile(latencies, 99) * 1000,
+            "worker_cpu_s": client["worker_cpu_s"]
+        })
+
+    sent = sum(c["sent"] for c in clients)
+    dropped = sum(c["ingest_dropped"] + c["processor"].dropped for c in clients)
+    report = {
+        "config": {
+            "clients": args.clients, "fps": args.fps, "duration_s": args.duration,
+            "model": args.model, "weights": args.weights, "exercise": args.exercise,
+            "frames": args.frames or f"synthetic {args.width}x{args.height}",
+            "cpu_count": os.cpu_count()
+        },
+        "throughput_fps": sum(c["processed"] for c in per_client) / elapsed,
+        "offered_fps": sent / elapsed,
+        "drop_rate": dropped / max(sent, 1),
+        "p50_ms": _percentile(all_latencies, 50) * 1000,
+        "p99_ms": _percentile(all_latencies, 99) * 1000,
+        "cpu_s_per_client": cpu_s / args.clients,
+        "cpu_util_per_client": cpu_s / elapsed / args.clients,
+        "rss_delta_mb_per_client": (rss_after - rss_before) / args.clients / 2**20,
+        "rss_mb": rss_after / 2**20,
+        "per_client": per_client
+    }
+
+    print(f"   throughput {report['throughput_fps']:.1f}/{report['offered_fps']:.1f} FPS, "
+          f"drop {report['drop_rate']:.1%}, p50 {report['p50_ms']:.0f}ms, p99 {report['p99_ms']:.0f}ms")
+    print(f"   per client: CPU {report['cpu_util_per_client']:.0%} di un core, "
+          f"RSS +{report['rss_delta_mb_per_client']:.1f}MB (totale {report['rss_mb']:.0f}MB)")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        report["baseline"] = {"file": args.baseline, "git_commit": baseline.get("git_commit")}
+        regressions = []
+        for key, higher_is_better in (("throughput_fps", True), ("drop_rate", False), ("p50_ms", False),
+                                      ("p99_ms", False), ("cpu_s_per_client", False)):
+            old, new = baseline.get(key), report[key]
+            if old is None:
+                continue
+            change = (new - old) / old if old else new - old  # da zero: variazione assoluta
+            worse = -change if higher_is_better else change
+            flag = "❌" if worse > args.tolerance else "✅"
+            if worse > args.tolerance:
+                regressions.append(key)
+            print(f"   {flag} {key:18s} {old:10.3f} -> {new:10.3f} ({change:+.1%})")
+        report["regressions"] = regressions
+        report["targets_met"] = not regressions
+
+    if not args.no_save:
+        os.makedirs(args.output_dir, exist_ok=True)
+        path = os.path.join(args.output_dir, f"load-{_git_commit()}-{args.clients}c-{time.strftime('%Y%m%d-%H%M%S')}.json")
+        with open(path, "w") as f:
+            json.dump(dict(report, git_commit=_git_commit(), timestamp=time.time()), f, indent=2)
+        print(f"💾 Risultati salvati in {path}")
+    return report
+
+def _int_list(value):
+    return [int(v) for v in value.split(',') if v.strip()]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Fitness Tracker AI")
+    parser.add_argument("--json", help="Salva i risultati in formato JSON")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("startup", help="Profilo import-time e time-to-first-inference")
+    p.add_argument("--weights", default="yolo11n-pose.pt")
+    p.add_argument("--top", type=int, default=15)
+    p.add_argument("--import-target-ms", type=float, default=1500.0)
+    p.add_argument("--first-inference-target-s", type=float, default=15.0)
+    p.add_argument("--skip-model", action="store_true", help="Solo profilo import")
+    p.set_defaults(func=cmd_startup)
+
+    p = sub.add_parser("threads", help="Sweep thread torch/OpenCV e pinning per core count")
+    p.add_argument("--weights", default="yolo11n-pose.pt")
+    p.add_argument("--cores", type=int, default=0, help="Core da considerare (default: affinity del processo)")
+    p.add_argument("--workers", type=_int_list, default=[1, 2, 4], help="Worker concorrenti, es. 1,2,4")
+    p.add_argument("--torch-threads", type=_int_list, default=[], help="Thread intra-op, es. 1,2,4")
+    p.add_argument("--interop-threads", type=int, default=1)
+    p.add_argument("--cv2-threads", type=int, default=1)
+    p.add_argument("--frames", type=int, default=30, help="Inference per worker")
+    p.add_argument("--oversubscribe", type=float, default=1.0, help="Limite workers*threads/core")
+    p.add_argument("--pin", action="store_true", help="Pin di ogni worker su core dedicati")
+    p.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    p.set_defaults(func=cmd_threads)
+
+    p = sub.add_parser("cascade", help="Report escalation/latenza/copertura della cascade")
+    p.add_argument("--frames", required=True, help="Cartella con la sequenza di frame JPEG")
+    p.add_argument("--exercise", default="squat", choices=["squat", "pushup", "bicep_curl"])
+    p.add_argument("--weights", default="yolo11n-pose.pt")
+    p.add_argument("--escalation-model", default="yolo11s-pose.pt", help="'' = solo imgsz maggiore")
+    p.add_argument("--imgsz", type=int, default=960)
+    p.add_argument("--gate", type=float, default=0.6)
+    p.add_argument("--max-rate", type=float, default=1.0, help="Escalation massime al secondo")
+    p.add_argument("--fps", type=float, default=3.0, help="Frame rate del replay")
+    p.set_defaults(func=cmd_cascade)
+
+    p = sub.add_parser("alloc", help="Allocazioni per frame (tracemalloc) e throughput del percorso per-frame")
+    p.add_argument("--exercise", default="squat", choices=["squat", "pushup", "bicep_curl"])
+    p.add_argument("--frames", type=int, default=2000)
+    p.add_argument("--warmup", type=int, default=200)
+    p.add_argument("--max-retained-bytes", type=int, default=16 * 1024)
+    p.add_argument("--min-reduction", type=float, default=0.10,
+                   help="Riduzione minima dei B/frame transitori del ring rispetto al legacy")
+    p.set_defaults(func=cmd_alloc)
+
+    p = sub.add_parser("payload", help="Bytes/frame e CPU server: frame intero vs letterbox lato client")
+    p.add_argument("--frames", help="Cartella di frame JPEG a risoluzione display (default: sintetici)")
+    p.add_argument("--count", type=int, default=60, help="Frame sintetici")
+    p.add_argument("--width", type=int, default=800)
+    p.add_argument("--height", type=int, default=600)
+    p.add_argument("--quality", type=int, default=80, help="Qualità JPEG (0.8 nel browser)")
+    p.add_argument("--repeat", type=int, default=5)
+    p.set_defaults(func=cmd_payload)
+
+    p = sub.add_parser("load", help="Load test multi-client sul percorso reale di ingestion")
+    p.add_argument("--clients", type=int, default=4)
+    p.add_argument("--fps", type=float, default=3.0, help="Frame al secondo per client")
+    p.add_argument("--duration", type=float, default=30.0, help="Secondi di carico")
+    p.add_argument("--frames", help="Cartella di frame JPEG da riprodurre (default: sintetici)")
+    p.add_argument("--count", type=int, default=30, help="Frame sintetici")
+    p.add_argument("--width", type=int, default=800)
+    p.add_argument("--height", type=int, default=600)
+    p.add_argument("--quality", type=int, default=80)
+    p.add_argument("--exercise", default="squat", choices=["squat", "pushup", "bicep_curl"])
+    p.add_argument("--model", default="yolo", choices=["yolo", "synthetic"],
+                   help="synthetic = solo overhead della pipeline, senza inference")
+    p.add_argument("--weights", default="yolo11n-pose.pt")
+    p.add_argument("--escalation-rate", type=float, default=0.0)
+    p.add_argument("--output-dir", default="bench_results")
+    p.add_argument("--no-save", action="store_true")
+    p.add_argument("--baseline", help="JSON di un run precedente da confrontare")
+    p.add_argument("--tolerance", type=float, default=0.10, help="Peggioramento tollerato vs baseline")
+    p.set_defaults(func=cmd_load)
+
+    args = parser.parse_args(argv)
+    report = args.func(args)
+
+    if args.json:
+        report.update({"command": args.command, "timestamp": time.time()})
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Risultati salvati in {args.json}")
+    return 0 if report.get("targets_met", True) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())